@@ -9,22 +9,51 @@ optimizing total area overhead and net wirelength.
 # pylint: disable=R0902, R0903
 
 import argparse
-import copy
+import heapq
 import math
 import sys
-import time
+from bisect import bisect_right
 from collections import namedtuple
-from itertools import combinations
-from random import randint, random, sample, shuffle, randrange
+from itertools import accumulate
+from time import perf_counter
+from random import randint, random, sample, randrange, seed as random_seed, setstate
 
+import batcheval
+import bstar
+import checkpoint
+import cluster
+import design
+import evalcache
+import geometry
 import graph
+import netlist
+import parallel
+import schedule
+import scheduler
+import seqpair
+import telemetry
 
-START_TIME = time.time()
-ABRT_TIME = START_TIME + 295.0
 SHUFFLE_LIMIT = 1000
-SHUFFLE_ABRT_TIME = START_TIME + 50.0
+# representations of floorplans, representation.Representation
+ENGINES = {'seqpair': seqpair.SequencePair, 'bstar': bstar.BStarTree}
+COST_MODES = ['phased', 'penalty']
+PENALTY_WEIGHT = 10.0 # of outline violation, relative to outline area
+REFINE_WINDOW = 3 # max distance in positive sequence of blocks swapped in refinement
+REFINE_PASSES = 2 # passes over neighborhood of refinement, whose time is reserved
 Terminal = namedtuple('Terminal', ['name', 'x', 'y'])
 
+# moves to perturb floorplan
+MOVE_SWAP_POS = 0 # swap 2 blocks in positive sequence
+MOVE_SWAP_BOTH = 1 # swap 2 blocks in both sequences
+MOVE_ROTATE = 2 # rotate a block
+MOVE_INSERT_POS = 3 # remove a block from positive sequence and insert it elsewhere
+MOVE_INSERT_BOTH = 4 # remove a block from both sequences and insert it elsewhere
+MOVE_NET = 5 # insert a block of a long net next to a block near center of the net
+MOVE_NAMES = ['swap_pos', 'swap_both', 'rotate', 'insert_pos', 'insert_both', 'net']
+NET_TOURNAMENT = 3 # nets sampled for MOVE_NET, the longest of which is picked
+ADAPT_RATE = 0.5 # weight of last temperature step in adapting probabilities of moves
+MIN_ACCEPT = 0.02 # acceptance ratio added to each move in adapting, so that none dies out
+
 class Block:
     '''Hard circuit block, say macro, to place in floorplan.
     '''
@@ -63,10 +92,13 @@ class Block:
 class Net:
     '''Interconnect between blocks and terminals.
     '''
-    def __init__(self, terminals):
-        '''Initialize a net connecting terminals, which include certain blocks and terminal
+    def __init__(self, blocks, weight=1, box=None):
+        '''Initialize a net connecting blocks, and fixed terminals collapsed into box (min_x,
+        min_y, max_x, max_y) if given, standing for weight nets of the same pins.
         '''
-        self.terminals = terminals
+        self.blocks = blocks
+        self.weight = weight
+        self.box = box
 
     def calc_length(self):
         '''Calculate the half-perimeter wire length (HPWL) of this net.
@@ -74,23 +106,56 @@ class Net:
         '''
         xx = []
         yy = []
-        for terminal in self.terminals:
-            if isinstance(terminal, Block):
-                center_x = (terminal.left_x + terminal.right_x) // 2
-                center_y = (terminal.top_y + terminal.bottom_y) // 2
-                xx.append(center_x)
-                yy.append(center_y)
-            elif isinstance(terminal, Terminal):
-                xx.append(terminal.x)
-                yy.append(terminal.y)
-        return (max(xx) - min(xx)) + (max(yy) - min(yy))
+        if self.box is not None:
+            xx.extend(self.box[0::2])
+            yy.extend(self.box[1::2])
+        for block in self.blocks:
+            xx.append((block.left_x + block.right_x) // 2)
+            yy.append((block.top_y + block.bottom_y) // 2)
+        return self.weight * ((max(xx) - min(xx)) + (max(yy) - min(yy)))
 
 class Floorplan:
     '''Floorplan consisting of copious blocks. Overlap among blocks is not allowed.
     The left-bottom corner is considered origin (0, 0), and no space is needed between two blocks.
     '''
-    def __init__(self, alpha):
+    def __init__(self, alpha, packer='lcs', use_arrays=False, sched=None, anneal_schedule=None,
+                 stats=None, engine='seqpair'):
         self.alpha = alpha
+        self.engine = engine # representation, 'seqpair' for sequence pair or 'bstar' for B*-tree
+        self.design = None # design.Design parsed from input files
+        self.telemetry = stats # telemetry.Telemetry, or None not to collect telemetry
+        self.checkpointer = None # checkpoint.Checkpointer, or None not to checkpoint
+        self.refine_window = REFINE_WINDOW # 0 not to refine after annealing
+        # 'phased' to anneal area until floorplan fits into outline and then descend greedily,
+        # 'penalty' to anneal cost plus penalty of outline violation throughout
+        self.cost_mode = 'phased'
+        self.penalty = PENALTY_WEIGHT
+        self.batch_size = 1 # candidate moves evaluated together per annealing step
+        self.multilevel = 0 # max blocks of clustered design in multilevel mode, 0 not to cluster
+        # share of remaining time to anneal, e.g. less to leave time for uncoarsening, or None
+        # to anneal until time reserved for refinement
+        self.anneal_share = None
+        self.final_temp = None # temperature at which annealing ended
+        self.progress_offset = 0.0 # progress of annealing made before resuming from checkpoint
+        # probability that a swap or rotation picks a critical block, one of zero slack in the
+        # dimension farther beyond outline, found at the start of each temperature step
+        self.critical_bias = 0.0
+        self._critical = []
+        # configured weights and current probabilities of moves, which adapt to acceptance
+        # ratio of each move after each temperature step if self.adapt_moves
+        self.move_weights = [1.0] * len(MOVE_NAMES)
+        self.adapt_moves = True
+        self.move_probs = None
+        self._move_cdf = None
+        self.set_move_probs(self.move_weights)
+        self.scheduler = sched if sched is not None else scheduler.Scheduler()
+        self.schedule = (anneal_schedule if anneal_schedule is not None else
+                         schedule.ClassicSchedule())
+        # normalization of area and wire length in cost, None for raw cost
+        self.area_norm = None
+        self.wire_norm = None
+        self.packer = packer # 'lcs' for sequence-pair packing, 'graph' for HCG/VCG
+        self.use_arrays = use_arrays # evaluate with array-backed geometry
         self.w_limit = -1
         self.h_limit = -1
         self.blocks = []
@@ -98,242 +163,847 @@ class Floorplan:
         self.terminals = []
         self.name_to_terminal = {}
         self.nets = []
-        self.seq_pair = None
+        self.netlist = None # netlist.Netlist reduced from nets of design, which self.nets are
+        self.rep = None # representation.Representation of self.engine
         self.rotate_lst = None
         self.is_valid = False
+        # state of simulated-annealing
+        self.cost = None
+        self.best_sol = None
+        self.best_rotate = None
+        self.best_cost = None
+        self.best_is_valid = False # whether the best floorplan fits into outline
+        # cache for incremental evaluation of wire length
+        self._dirty_blocks = None # indexes of blocks moved since last evaluation, None for all
+        self._block_nets = [] # indexes of nets connected to each block
+        self._net_hpwl = [] # HPWL of each net
+        self._wire_len = 0
+        # array-backed geometry, built on first evaluation if self.use_arrays
+        self._block_array = None
+        self._net_array = None
+        # blocks of each net, and nets with blocks, for net-aware moves
+        self._net_blocks = []
+        self._movable_nets = []
+        # constraint graphs of last packed sequence pair, (pos_seq, neg_seq, hcg, vcg)
+        self._graphs = None
+        # cache of evaluated floorplans, built before first loop of moves, and hash of rotation
+        # of blocks of current floorplan, kept up to date by moves
+        self.eval_cache_size = evalcache.DEFAULT_SIZE # 0 not to cache
+        self.eval_cache = None
+        self._rotate_hash = 0
 
-    def place_block(self):
+    def place_block(self, nworker=1, seed=None, resume=None):
         '''Do floorplanning via simulated-annealing.
+        With nworker > 1, nworker replicas are annealed in parallel, seeded by seed.
+        Annealing resumes from checkpoint state resume, if given, skipping initialization.
+        With more blocks than self.multilevel, blocks are clustered and floorplanned level by
+        level.
+        '''
+        if (resume is None and 0 < self.multilevel < len(self.blocks) and
+                cluster.place_block(self, nworker, seed, self.multilevel)):
+            return
+        if nworker > 1:
+            parallel.place_block(self, nworker, seed, SHUFFLE_LIMIT, resume)
+            self.refine()
+            return
+        if resume is None:
+            # initial solution
+            self.scheduler.start_phase('init')
+            self._initialize_rep()
+            self.scheduler.start_phase('anneal', self.refine_reserve(), self.anneal_share)
+            # self.rep = ([0,6,3,4,1,5,2,7], [7,3,6,1,4,2,5,0])
+            # print(self.rep)
+            temp = self.init_schedule() # T
+            self.start_anneal()
+        else:
+            self.scheduler.start_phase('anneal', self.refine_reserve())
+            temp = self.resume_anneal(resume)
+            setstate(resume['rng_state'])
+        print('Init cost: {:,}'.format(self.cost))
+
+        uphill_lim, move_lim = self.schedule.step_limits(len(self.blocks)) # N
+
+        # while reject ratio in previous round was not so high and time is not up
+        while True:
+            step_start = perf_counter()
+            move_cnt, uphill, reject_cnt = self.anneal_at(temp, uphill_lim, move_lim)
+            if self.telemetry is not None:
+                self.telemetry.record_step(temp, move_cnt, uphill, reject_cnt,
+                                           perf_counter() - step_start)
+            reject_ratio = reject_cnt / move_cnt
+            progress = self.anneal_progress()
+            temp = self.schedule.next_temp(temp, 1.0 - reject_ratio, progress)
+            if self.schedule.is_frozen(reject_ratio, progress) or self.scheduler.time_up():
+                if self.scheduler.time_up():
+                    print('SA ends at time-up', flush=True)
+                else:
+                    print('SA ends due to heavy rejection', flush=True)
+                break
+            if self.checkpointer is not None:
+                self.checkpointer.maybe_save(self, temp)
+
+        if self.checkpointer is not None:
+            self.checkpointer.save(self, temp)
+        self.final_temp = temp
+        self.finish_anneal()
+        self.refine()
+
+    def init_schedule(self):
+        '''Sample random moves around current floorplan for adaptive schedule, to normalize
+        area and wire length in cost by their averages and to estimate initial temperature.
+        Return initial temperature.
+        '''
+        if not self.schedule.adaptive:
+            return self.schedule.start([])
+        samples = [] # (width, height, wire_len)
+        self._sync_hash()
+        for _ in range(self.schedule.nsample):
+            undo = self._perturb(self._pick_move())
+            samples.append(self._evaluate())
+            self._undo(undo)
+        width, height = self._calc_area()
+        samples.append((width, height, self._calc_wire_len()))
+        self.area_norm = (sum(self._calc_area_cost(sample[0], sample[1]) for sample in samples) /
+                          len(samples) or 1.0)
+        self.wire_norm = sum(sample[2] for sample in samples) / len(samples) or 1.0
+        cost = self._calc_move_cost(*samples[-1])
+        deltas = [self._calc_move_cost(*sample) - cost for sample in samples]
+        return self.schedule.start([delta for delta in deltas if delta > 0])
+
+    def sample_uphill(self, nsample):
+        '''Make nsample random moves around current floorplan, undoing each.
+        Return cost deltas of the uphill ones.
         '''
-        # initial solution
-        self._initialize_seq_pair()
-        # self.seq_pair = ([0,6,3,4,1,5,2,7], [7,3,6,1,4,2,5,0])
-        # print(self.seq_pair)
+        self._sync_hash()
+        cost = self._calc_move_cost(*self._evaluate())
+        deltas = []
+        for _ in range(nsample):
+            undo = self._perturb(self._pick_move())
+            delta = self._calc_move_cost(*self._evaluate()) - cost
+            self._undo(undo)
+            if delta > 0:
+                deltas.append(delta)
+        return deltas
 
-        best_sol = copy.deepcopy(self.seq_pair) # Best
-        best_rotate = copy.copy(self.rotate_lst)
+    def start_anneal(self):
+        '''Evaluate cost of current floorplan, which is also the best one so far.
+        '''
+        width, height = self._calc_area()
+        wire_len = self._calc_wire_len()
+        self.cost = self._calc_move_cost(width, height, wire_len)
+        self.best_sol, self.best_rotate = self._snapshot() # Best
+        self.best_cost = self.cost
+        self.best_is_valid = ((self.is_valid or self.cost_mode == 'penalty') and
+                              self._is_valid(width, height))
 
-        temp = 200.0 # T
-        uphill_lim = 50 * len(self.blocks) # N
-        cool_ratio = 0.98
+    def resume_anneal(self, state):
+        '''Restore current and best floorplans of checkpoint state, and evaluate their cost.
+        Return temperature to resume annealing at.
+        '''
+        self.area_norm, self.wire_norm = state['norms']
+        self.progress_offset = state['progress']
+        self.is_valid = state['is_valid']
+        self.rep = seqpair.SequencePair(*state['best_sol'])
+        self.rotate_lst = [bool(rotate) for rotate in state['best_rotate']]
+        self.start_anneal()
+        best = self.best_sol, self.best_rotate, self.best_cost, self.best_is_valid
+        self.rep = seqpair.SequencePair(*state['seq_pair'])
+        self.rotate_lst = [bool(rotate) for rotate in state['rotate_lst']]
+        self.start_anneal()
+        self.best_sol, self.best_rotate, self.best_cost, self.best_is_valid = best
+        if self.adapt_moves:
+            self.set_move_probs(state['move_probs'])
+        if self.telemetry is not None and state['telemetry'] is not None:
+            self.telemetry.merge(state['telemetry'])
+            self.telemetry.steps[:0] = state['telemetry'].steps
+        print('Resume at temperature {:.6g}, progress {:.0%}, cost: {:,}, best: {:,}'.format(
+            state['temp'], self.progress_offset, self.cost, self.best_cost))
+        return state['temp']
 
+    def anneal_progress(self):
+        '''Return progress of annealing from 0.0 to 1.0 in time, counting progress made before
+        resuming as done.
+        '''
+        return self.progress_offset + (1.0 - self.progress_offset) * self.scheduler.progress()
+
+    def anneal_at(self, temp, uphill_lim, move_lim):
+        '''Perturb floorplan at temperature temp until uphill moves exceed uphill_lim, moves
+        exceed move_lim or time of annealing is up.
+        Return (move_cnt, uphill, reject_cnt).
+        '''
+        if self.batch_size > 1:
+            return self._anneal_batch_at(temp, uphill_lim, move_lim)
         move_cnt = 0 # MT
         uphill = 0 # uphill
         reject_cnt = 0 # reject
+        cost = self.cost
+        stats = self.telemetry
+        tried = [0] * len(MOVE_NAMES) # by move type
+        accepted = [0] * len(MOVE_NAMES)
+        self._sync_hash()
+        if self.critical_bias > 0:
+            self._critical = self._find_critical_blocks()
+        while True:
+            move = self._pick_move()
+            tried[move] += 1
+            move_cnt += 1
+            undo = self._perturb(move)
 
-        width, height = self._calc_area()
-        wire_len = self._calc_wire_len()
-        cost = self._calc_cost(self._calc_area_cost(), wire_len)
-        best_cost = cost
-        print('Init cost: {:,}'.format(cost))
+            new_width, new_height, new_wire_len = self._evaluate()
+            new_cost = self._calc_move_cost(new_width, new_height, new_wire_len)
+            is_accepted, is_uphill, cost = self._judge(temp, cost, new_width, new_height,
+                                                       new_wire_len, new_cost)
+            if is_uphill:
+                uphill += 1
+            if is_accepted:
+                accepted[move] += 1
+            else:
+                # restore floorplan
+                self._undo(undo)
+                reject_cnt += 1
+            if stats is not None:
+                stats.count_move(move, is_accepted)
+            if (uphill > uphill_lim) or (move_cnt > move_lim) or self.scheduler.time_up():
+                break
+        self.cost = cost
+        if self.adapt_moves:
+            self._adapt_move_probs(tried, accepted)
+        return move_cnt, uphill, reject_cnt
 
-        # while reject ratio in previous round was not so high and time is not up
+    def _anneal_batch_at(self, temp, uphill_lim, move_lim):
+        '''Anneal as self.anneal_at() does, but make self.batch_size candidate moves per step,
+        evaluate them together by NumPy kernels, and judge only one of them: drawn by Boltzmann
+        weight of cost at temperature temp while moves are judged by Metropolis criterion, and
+        the best one during greedy descent. Limits, counts returned, and acceptance ratios which
+        probabilities of moves adapt to, are of steps, i.e. judged candidates, and each step is
+        charged as self.batch_size moves of time.
+        Return (move_cnt, uphill, reject_cnt).
+        '''
+        np = batcheval.np
+        nbatch = self.batch_size
+        uphill_lim = max(1, uphill_lim // nbatch)
+        move_lim = max(1, move_lim // nbatch)
+        move_cnt = 0
+        uphill = 0
+        reject_cnt = 0
+        cost = self.cost
+        stats = self.telemetry
+        tried = [0] * len(MOVE_NAMES) # by move type
+        accepted = [0] * len(MOVE_NAMES)
+        if self._block_array is None:
+            self._build_arrays()
+        raw_widths = self._block_array.raw_widths
+        raw_heights = self._block_array.raw_heights
+        self._sync_hash()
+        if self.critical_bias > 0:
+            self._critical = self._find_critical_blocks()
         while True:
-            move_cnt = 0
-            uphill = 0
-            reject_cnt = 0
-            while True:
-                move = randint(0, 2)
-                move_cnt += 1
-                old_seq_pair = copy.deepcopy(self.seq_pair)
-                old_rotate = copy.copy(self.rotate_lst)
-                if move == 0:
-                    # Move1: swap 2 blocks in posive sequence only
-                    idxes = sample(range(len(self.blocks)), 2) # index of block in list to swap
-                    (self.seq_pair[0][idxes[0]], self.seq_pair[0][idxes[1]]) = (
-                        self.seq_pair[0][idxes[1]], self.seq_pair[0][idxes[0]])
-                elif move == 1:
-                    # Move2: swap 2 blocks in both positive and negative sequences
-                    blk_idxes = sample(range(len(self.blocks)), 2)
-                    idx0_in_p_seq = self.seq_pair[0].index(blk_idxes[0])
-                    idx1_in_p_seq = self.seq_pair[0].index(blk_idxes[1])
-                    (self.seq_pair[0][idx0_in_p_seq], self.seq_pair[0][idx1_in_p_seq]) = (
-                        self.seq_pair[0][idx1_in_p_seq], self.seq_pair[0][idx0_in_p_seq])
-                    idx0_in_n_seq = self.seq_pair[1].index(blk_idxes[0])
-                    idx1_in_n_seq = self.seq_pair[1].index(blk_idxes[1])
-                    (self.seq_pair[1][idx0_in_n_seq], self.seq_pair[1][idx1_in_n_seq]) = (
-                        self.seq_pair[1][idx1_in_n_seq], self.seq_pair[1][idx0_in_n_seq])
-                else:
-                    # Move3: rotate an arbitrary block
-                    idx = randrange(0, len(self.rotate_lst))
-                    self.rotate_lst[idx] = True if not self.rotate_lst[idx] else False
-
-                new_width, new_height = self._calc_area()
-                new_wire_len = self._calc_wire_len()
-                new_cost = self._calc_cost(self._calc_area_cost(), new_wire_len)
-                delta_cost = new_cost - cost
-
-                if not self.is_valid:
-                    if (delta_cost < 0.0 or
-                            random() < math.exp(-1*delta_cost/temp)):
-                        cost = new_cost
-                        if delta_cost > 0:
-                            uphill += 1
-                        if new_cost < best_cost:
-                            best_sol = copy.deepcopy(self.seq_pair)
-                            best_rotate = copy.copy(self.rotate_lst)
-                            best_cost = new_cost
-                    # encounter valid solution
-                    elif self._is_valid(new_width, new_height):
-                        print('Encounter valid floorplan: {}x{}'.format(new_width, new_height))
-                        self.is_valid = True
-                        cost = self._calc_cost(self._calc_area_cost(), self._calc_wire_len())
-                        best_sol = copy.deepcopy(self.seq_pair)
-                        best_rotate = copy.deepcopy(self.rotate_lst)
-                        best_cost = new_cost
-                    else:
-                        # restore sequence pair
-                        self.seq_pair = old_seq_pair
-                        self.rotate_lst = old_rotate
-                        reject_cnt += 1
-                else:
-                    if (delta_cost < 0.0 and
-                            self._is_valid(new_width, new_height)):
-                        cost = new_cost
-                        if new_cost < best_cost:
-                            best_sol = copy.deepcopy(self.seq_pair)
-                            best_rotate = copy.copy(self.rotate_lst)
-                            best_cost = new_cost
-                    else:
-                        # restore sequence pair
-                        self.seq_pair = old_seq_pair
-                        self.rotate_lst = old_rotate
-                        reject_cnt += 1
-
-                if (uphill > uphill_lim) or (move_cnt > 2*uphill_lim) or (time.time() >= ABRT_TIME):
-                    break
-            temp = cool_ratio * temp
-            if (reject_cnt/move_cnt) > 0.99 or (time.time() >= ABRT_TIME):
-                if time.time() >= ABRT_TIME:
-                    print('SA ends at time-up', flush=True)
-                else:
-                    print('SA ends due to heavy rejection', flush=True)
+            # candidates are made and undone one by one, keeping their sequences and rotation
+            moves = []
+            records = []
+            pos_seqs = []
+            neg_seqs = []
+            rotate_lsts = []
+            for _ in range(nbatch):
+                move = self._pick_move()
+                record = self._perturb(move)
+                moves.append(move)
+                records.append(record)
+                pos_seqs.append(self.rep.pos_seq[:])
+                neg_seqs.append(self.rep.neg_seq[:])
+                rotate_lsts.append(self.rotate_lst[:])
+                self._undo(record)
+
+            start = perf_counter()
+            rotated = np.array(rotate_lsts, dtype=bool)
+            widths = np.where(rotated, raw_heights, raw_widths)
+            heights = np.where(rotated, raw_widths, raw_heights)
+            xs, ys, fp_widths, fp_heights = batcheval.pack(np.array(pos_seqs), np.array(neg_seqs),
+                                                           widths, heights)
+            packed = perf_counter()
+            wire_lens = self._net_array.calc_wire_lens((2*xs + widths) // 2,
+                                                       (2*ys + heights) // 2)
+            if stats is not None:
+                stats.add_time('pack', packed - start)
+                stats.add_time('hpwl', perf_counter() - packed)
+            sizes = list(zip(fp_widths.tolist(), fp_heights.tolist(), wire_lens.tolist()))
+            costs = [self._calc_move_cost(*size) for size in sizes]
+            min_cost = min(costs)
+            if self.cost_mode == 'penalty' or not self.is_valid:
+                cdf = list(accumulate(math.exp((min_cost - new_cost) / temp) for new_cost in costs))
+                chosen = min(bisect_right(cdf, random() * cdf[-1]), nbatch - 1)
+            else:
+                chosen = costs.index(min_cost)
+
+            move_cnt += 1
+            tried[moves[chosen]] += 1
+            record = records[chosen]
+            self._redo(record)
+            is_accepted, is_uphill, cost = self._judge(temp, cost, *sizes[chosen], costs[chosen])
+            if is_uphill:
+                uphill += 1
+            if is_accepted:
+                accepted[moves[chosen]] += 1
+                self._set_block_coords(xs[chosen].tolist(), ys[chosen].tolist(),
+                                       widths[chosen].tolist(), heights[chosen].tolist())
+            else:
+                self._undo(record)
+                reject_cnt += 1
+            if stats is not None:
+                stats.count_move(record[0], is_accepted)
+            self.scheduler.count(nbatch - 1)
+            if (uphill > uphill_lim) or (move_cnt > move_lim) or self.scheduler.time_up():
                 break
+        self.cost = cost
+        if self.adapt_moves:
+            self._adapt_move_probs(tried, accepted)
+        return move_cnt, uphill, reject_cnt
+
+    def _judge(self, temp, cost, width, height, wire_len, new_cost):
+        '''Judge the move just made from floorplan of cost cost to one of size width x height,
+        wire length wire_len and cost new_cost at temperature temp, as the cost mode says, and
+        keep the new floorplan if it is the best so far.
+        Return (accepted, uphill, cost of current floorplan after the move is accepted or not).
+        '''
+        delta_cost = new_cost - cost
+        if self.cost_mode == 'penalty':
+            # Metropolis throughout, keeping the best floorplan fitting into outline
+            if delta_cost < 0.0 or random() < math.exp(-1*delta_cost/temp):
+                new_valid = self._is_valid(width, height)
+                if (new_valid, -new_cost) > (self.best_is_valid, -self.best_cost):
+                    self.best_sol, self.best_rotate = self._snapshot()
+                    self.best_cost = new_cost
+                    self.best_is_valid = new_valid
+                return True, delta_cost > 0, new_cost
+        elif not self.is_valid:
+            # encounter valid solution, whether the move is uphill or not
+            if self._is_valid(width, height):
+                print('Encounter valid floorplan: {}x{}'.format(width, height))
+                self.is_valid = True
+                cost = self._calc_move_cost(width, height, wire_len)
+                self.best_sol, self.best_rotate = self._snapshot()
+                self.best_cost = cost
+                self.best_is_valid = True
+                return True, False, cost
+            if delta_cost < 0.0 or random() < math.exp(-1*delta_cost/temp):
+                if new_cost < self.best_cost:
+                    self.best_sol, self.best_rotate = self._snapshot()
+                    self.best_cost = new_cost
+                return True, delta_cost > 0, new_cost
+        elif delta_cost < 0.0 and self._is_valid(width, height):
+            if new_cost < self.best_cost:
+                self.best_sol, self.best_rotate = self._snapshot()
+                self.best_cost = new_cost
+            return True, False, new_cost
+        return False, False, cost
+
+    def set_move_weights(self, weights):
+        '''Configure weights of moves, indexed by move type, and reset probabilities of moves to
+        them.
+        '''
+        if len(weights) != len(MOVE_NAMES) or min(weights) < 0 or not any(weights):
+            raise ValueError('expected {} non-negative weights of moves, not all zero'.format(
+                len(MOVE_NAMES)))
+        self.move_weights = list(weights)
+        self.set_move_probs(self.move_weights)
+
+    def set_move_probs(self, probs):
+        '''Set probabilities of moves, indexed by move type, which are normalized.
+        '''
+        total = sum(probs)
+        self.move_probs = [prob / total for prob in probs]
+        self._move_cdf = list(accumulate(self.move_probs))
+
+    def _pick_move(self):
+        '''Return a random move type by probabilities of moves.
+        '''
+        move = bisect_right(self._move_cdf, random() * self._move_cdf[-1])
+        return min(move, len(MOVE_NAMES) - 1)
 
+    def _adapt_move_probs(self, tried, accepted):
+        '''Move probabilities of moves towards their configured weights scaled by acceptance
+        ratios of moves tried in last temperature step.
+        '''
+        mean_ratio = sum(accepted) / max(sum(tried), 1) # of moves not tried
+        ratios = [accepted[move] / tried[move] if tried[move] else mean_ratio
+                  for move in range(len(MOVE_NAMES))]
+        targets = [weight * (MIN_ACCEPT + ratio) for weight, ratio in
+                   zip(self.move_weights, ratios)]
+        total = sum(targets)
+        self.set_move_probs([(1.0 - ADAPT_RATE) * prob + ADAPT_RATE * target / total
+                             for prob, target in zip(self.move_probs, targets)])
+
+    def finish_anneal(self):
+        '''Restore the best floorplan found by simulated-annealing.
+        '''
         self.is_valid = True # for correct cost evaluation
-        self.seq_pair = best_sol
-        self.rotate_lst = best_rotate
+        self._restore(self.best_sol, self.best_rotate)
         width, height = self._calc_area()
-        print('Best cost: {:,}'.format(best_cost))
+        print('Best cost: {:,}'.format(self.best_cost))
         print('Area: {}x{}={:,}'.format(width, height, width*height))
         print('Target: {}x{}={:,}'.format(self.w_limit, self.h_limit, self.w_limit*self.h_limit))
 
+    def refine(self):
+        '''Improve the best floorplan greedily after annealing: try every move in a neighborhood,
+        i.e. rotation of each block, and swaps of blocks at most self.refine_window apart in the
+        representation, applying improving ones until a local optimum is reached or time of
+        refinement is up.
+        '''
+        if self.refine_window <= 0:
+            return
+        self.scheduler.start_phase('refine')
+        stats = self.telemetry
+        width, height = self._calc_area()
+        start_cost = self.calc_cost()
+        is_valid = self._is_valid(width, height)
+        cost = self._calc_refine_cost(width, height, self._calc_wire_len())
+        move_cnt = 0
+        improve_cnt = 0
+        improved = True
+        self._sync_hash()
+        while improved and not self.scheduler.time_up():
+            improved = False
+            for record in self._neighborhood():
+                move_cnt += 1
+                self._redo(record)
+                new_width, new_height, new_wire_len = self._evaluate()
+                new_cost = self._calc_refine_cost(new_width, new_height, new_wire_len)
+                new_valid = self._is_valid(new_width, new_height)
+                # valid floorplan never turns invalid, while invalid one may turn valid
+                accepted = (new_valid, -new_cost) > (is_valid, -cost)
+                if accepted:
+                    cost, is_valid = new_cost, new_valid
+                    improve_cnt += 1
+                    improved = True
+                else:
+                    self._undo(record)
+                if stats is not None:
+                    stats.count_move(record[0], accepted)
+                if self.scheduler.time_up():
+                    break
+        self.best_sol, self.best_rotate = self._snapshot()
+        self.best_cost = self._calc_move_cost(*self._evaluate())
+        self.best_is_valid = is_valid
+        end_cost = self.calc_cost()
+        print('Refine: cost {:,} -> {:,} ({:.2%}) by {} of {} moves'.format(
+            start_cost, end_cost, (start_cost - end_cost) / start_cost if start_cost else 0.0,
+            improve_cnt, move_cnt))
+
+    def refine_reserve(self):
+        '''Return number of moves of refinement, to reserve time for it.
+        '''
+        if self.refine_window <= 0:
+            return 0
+        return REFINE_PASSES * len(self.blocks) * (1 + 2 * self.refine_window)
+
+    def derive(self, dsgn):
+        '''Return floorplan of another design, e.g. a clustered one, with the same options,
+        sharing scheduler, schedule and telemetry.
+        '''
+        flpr = Floorplan(self.alpha, self.packer, self.use_arrays, self.scheduler,
+                         self.schedule, self.telemetry, self.engine)
+        flpr.refine_window = self.refine_window
+        flpr.cost_mode = self.cost_mode
+        flpr.penalty = self.penalty
+        flpr.set_move_weights(self.move_weights)
+        flpr.adapt_moves = self.adapt_moves
+        flpr.eval_cache_size = self.eval_cache_size
+        flpr.batch_size = self.batch_size
+        flpr.critical_bias = self.critical_bias
+        flpr.load_design(dsgn)
+        return flpr
+
+    def _neighborhood(self):
+        '''Generate undo records of moves in neighborhood of current floorplan for refinement:
+        rotation of each block, and swaps of blocks at most self.refine_window apart in the
+        representation.
+        '''
+        for idx in range(len(self.blocks)):
+            yield (MOVE_ROTATE, idx)
+        for record in self.rep.neighborhood(self.refine_window):
+            yield (MOVE_SWAP_BOTH if record[0] else MOVE_SWAP_POS, record)
+
+    def sample_reps(self, nsample, ntop):
+        '''Shuffle representation nsample times or until time of initialization is up.
+        Return list of up to ntop best (area_cost, rep), best first.
+        '''
+        self.rep = self._new_rep()
+        heap = [] # max-heap of (-area_cost, order, rep)
+        for order in range(nsample):
+            self.rep.shuffle()
+            width, height = self._calc_area()
+            cost = self._calc_area_cost(width, height) + self._calc_penalty(width, height)
+            if len(heap) < ntop:
+                heapq.heappush(heap, (-cost, order, self.rep.copy()))
+            elif -heap[0][0] > cost:
+                heapq.heapreplace(heap, (-cost, order, self.rep.copy()))
+            if self.scheduler.time_up():
+                break
+        return [(-neg_cost, rep) for neg_cost, _, rep in sorted(heap, reverse=True)]
+
+    def _new_rep(self):
+        '''Return initial representation of floorplan of self.engine.
+        '''
+        return ENGINES[self.engine].initial(len(self.blocks))
+
+    def _perturb(self, move):
+        '''Perturb current floorplan by given move.
+        Return undo record of the move, with which self._undo() restores the floorplan.
+        '''
+        if move == MOVE_SWAP_POS or move == MOVE_SWAP_BOTH:
+            # Move1: swap 2 blocks in posive sequence only
+            # Move2: swap 2 blocks in both positive and negative sequences
+            record = self.rep.swap(*self._sample_pair(), both=move == MOVE_SWAP_BOTH)
+            return (MOVE_SWAP_BOTH if record[0] else MOVE_SWAP_POS, record)
+        elif move == MOVE_ROTATE:
+            # Move3: rotate an arbitrary block
+            if self._critical and random() < self.critical_bias:
+                idx = self._critical[randrange(len(self._critical))]
+            else:
+                idx = randrange(0, len(self.rotate_lst))
+            self.rotate_lst[idx] = not self.rotate_lst[idx]
+            if self.eval_cache is not None:
+                self._rotate_hash ^= self.eval_cache.rotate_keys[idx]
+            return (move, idx)
+        elif move == MOVE_INSERT_POS or move == MOVE_INSERT_BOTH:
+            # Move4: move a block next to another one in positive sequence
+            # Move5: move a block next to another one in both sequences
+            blk, target = sample(range(len(self.blocks)), 2)
+            record = self.rep.insert(blk, target, randint(0, 1), both=move == MOVE_INSERT_BOTH)
+            return (MOVE_INSERT_BOTH if record[0] else MOVE_INSERT_POS, record)
+        else:
+            # Move6: move a block of a long net towards center of the net
+            return self._perturb_net()
+
+    def _sample_pair(self):
+        '''Return 2 distinct random blocks, the first of which is critical with probability
+        self.critical_bias.
+        '''
+        nblock = len(self.blocks)
+        if not self._critical or random() >= self.critical_bias:
+            return sample(range(nblock), 2)
+        blk = self._critical[randrange(len(self._critical))]
+        return [blk, (blk + randrange(1, nblock)) % nblock]
+
+    def _find_critical_blocks(self):
+        '''Pack current floorplan, and return its critical blocks, those of zero slack in the
+        dimension farther beyond outline relative to it; only moving them may shrink that
+        dimension.
+        '''
+        width, height = self._calc_area()
+        if self.packer == 'graph':
+            hcg, vcg = self._graphs[2:]
+            x_slacks, y_slacks = hcg.get_slacks(), vcg.get_slacks()
+        else:
+            self._set_block_rotation()
+            x_slacks, y_slacks = self.rep.slacks(
+                [block.get_width() for block in self.blocks],
+                [block.get_height() for block in self.blocks])
+        if width * self.h_limit >= height * self.w_limit:
+            return graph.critical_nodes(x_slacks)
+        return graph.critical_nodes(y_slacks)
+
+    def _perturb_net(self):
+        '''Pick the longest of a few random nets, and insert its block farthest from center of
+        the net next to its block nearest the center, or a random one if there is no other, on a
+        random side, in both sequences.
+        Return undo record of the move.
+        '''
+        if not self._movable_nets:
+            return self._perturb(MOVE_INSERT_BOTH)
+        net_idxes = [self._movable_nets[randrange(len(self._movable_nets))]
+                     for _ in range(NET_TOURNAMENT)]
+        if len(self._net_hpwl) == len(self.nets):
+            # HPWL cached by incremental evaluation
+            net_idx = max(net_idxes, key=lambda idx: self._net_hpwl[idx])
+        else:
+            boxes = {idx: self._net_box(idx) for idx in net_idxes}
+            net_idx = max(net_idxes, key=lambda idx: self.nets[idx].weight * (
+                boxes[idx][2] - boxes[idx][0] + boxes[idx][3] - boxes[idx][1]))
+        min_x, min_y, max_x, max_y = self._net_box(net_idx)
+        center_x = (min_x + max_x) / 2
+        center_y = (min_y + max_y) / 2
+
+        def distance(blk):
+            '''Return Manhattan distance from center of block blk to center of the net.
+            '''
+            x, y = self._block_center(blk)
+            return abs(x - center_x) + abs(y - center_y)
+
+        net_blocks = self._net_blocks[net_idx]
+        blk = max(net_blocks, key=distance)
+        others = [other for other in net_blocks if other != blk]
+        if others:
+            target = min(others, key=distance)
+        else:
+            target = (blk + randrange(1, len(self.blocks))) % len(self.blocks)
+        return (MOVE_NET, self.rep.insert(blk, target, randint(0, 1)))
+
+    def _block_center(self, blk):
+        '''Return center of block blk as last packed, rounded down as Net.calc_length() does,
+        from array-backed geometry if it is in use.
+        '''
+        if self._block_array is not None and self.use_arrays and self.packer != 'graph':
+            block_array = self._block_array
+            return ((2*int(block_array.left_x[blk]) + int(block_array.widths[blk])) // 2,
+                    (2*int(block_array.bottom_y[blk]) + int(block_array.heights[blk])) // 2)
+        block = self.blocks[blk]
+        return (block.left_x + block.right_x) // 2, (block.top_y + block.bottom_y) // 2
+
+    def _net_box(self, net_idx):
+        '''Return bounding box (min_x, min_y, max_x, max_y) of pins of net as last packed.
+        '''
+        points = [self._block_center(blk) for blk in self._net_blocks[net_idx]]
+        box = self.nets[net_idx].box
+        if box is not None:
+            points.extend((box[:2], box[2:]))
+        xx = [x for x, _ in points]
+        yy = [y for _, y in points]
+        return min(xx), min(yy), max(xx), max(yy)
+
+    def _undo(self, record):
+        '''Restore floorplan perturbed by the move of given undo record.
+        '''
+        if record[0] == MOVE_ROTATE:
+            self.rotate_lst[record[1]] = not self.rotate_lst[record[1]]
+            if self.eval_cache is not None:
+                self._rotate_hash ^= self.eval_cache.rotate_keys[record[1]]
+        else:
+            self.rep.undo(record[1])
+
+    def _redo(self, record):
+        '''Make the move of given undo record again after self._undo() restored it.
+        '''
+        if record[0] == MOVE_ROTATE:
+            self._undo(record) # involution
+        else:
+            self.rep.redo(record[1])
+
+    def _snapshot(self):
+        '''Return copy of current (rep, rotate_lst).
+        '''
+        if self.telemetry is None:
+            return self.rep.copy(), self.rotate_lst[:]
+        start = perf_counter()
+        snapshot = self.rep.copy(), self.rotate_lst[:]
+        self.telemetry.add_time('copy', perf_counter() - start)
+        return snapshot
+
+    def _sync_hash(self):
+        '''Hash current floorplan for lookups in self.eval_cache, building the cache first if
+        needed, before a loop of moves, which keep the hash up to date.
+        '''
+        if self.eval_cache_size <= 0:
+            return
+        if self.eval_cache is None:
+            nblock = len(self.blocks)
+            self.eval_cache = evalcache.EvalCache(nblock, self.eval_cache_size,
+                                                  ENGINES[self.engine].new_keys(nblock))
+        if self.rep.keys is not self.eval_cache.keys:
+            self.rep.set_keys(self.eval_cache.keys)
+        self._rotate_hash = self.eval_cache.rotate_hash(self.rotate_lst)
+
+    def _evaluate(self):
+        '''Evaluate area and wire length of current floorplan, or look them up in
+        self.eval_cache if it was evaluated recently. On a hit, blocks are not packed and keep
+        coordinates of the last evaluated floorplan, which incremental evaluation of wire length
+        is consistent with; so the report, which calls self._calc_area(), always packs.
+        Return (width, height, wire_len).
+        '''
+        cache = self.eval_cache
+        if cache is not None:
+            key = self.rep.hash ^ self._rotate_hash
+            result = cache.get(key)
+            if self.telemetry is not None:
+                self.telemetry.count_eval(result is not None)
+            if result is not None:
+                return result
+        if self.telemetry is None:
+            width, height = self._calc_area()
+            result = width, height, self._calc_wire_len()
+        else:
+            result = self._timed_evaluate()
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    def _timed_evaluate(self):
+        '''Evaluate area and wire length as self._calc_area() and self._calc_wire_len() do, timing
+        both into telemetry.
+        Return (width, height, wire_len).
+        '''
+        start = perf_counter()
+        width, height = self._calc_area()
+        packed = perf_counter()
+        wire_len = self._calc_wire_len()
+        self.telemetry.add_time('pack', packed - start)
+        self.telemetry.add_time('hpwl', perf_counter() - packed)
+        return width, height, wire_len
+
+    def _restore(self, rep, rotate_lst):
+        '''Restore floorplan to a snapshot taken by self._snapshot().
+        '''
+        self.rep.assign(rep)
+        self.rotate_lst[:] = rotate_lst
+        if self.eval_cache is not None:
+            self._rotate_hash = self.eval_cache.rotate_hash(self.rotate_lst)
+
     def parse_block_file(self, block_file):
         '''Parse input block file.
+        Raise design.ParseError if it is malformed.
         '''
-        try:
-            with open(block_file, 'rt') as f:
-                self.w_limit, self.h_limit = [int(str_) for str_ in f.readline().split()[1:]]
-                nblock = int(f.readline().split()[1])
-                nterminal = int(f.readline().split()[1])
-                for line in f:
-                    if not line.strip():
-                        continue
-                    strs = line.split()
-                    if strs[1] == 'terminal':
-                        terminal = Terminal(name=strs[0], x=int(strs[2]), y=int(strs[3]))
-                        self.terminals.append(terminal)
-                        self.name_to_block[terminal.name] = terminal
-                    else:
-                        block = Block(name=strs[0], width=int(strs[1]), height=int(strs[2]))
-                        self.blocks.append(block)
-                        self.name_to_block[block.name] = block
-                assert len(self.blocks) == nblock, 'Wrong block number'
-                assert len(self.terminals) == nterminal, 'Wrong terminal number'
-        except OSError as err:
-            sys.exit(err)
-        self.rotate_lst = [False for _ in range(len(self.blocks))]
+        self.design = design.Design()
+        self.design.read_blocks(block_file)
+        self._load_blocks()
 
     def parse_net_file(self, net_file):
-        '''Parse input net files.
+        '''Parse input net files, after block file.
+        Raise design.ParseError if it is malformed.
         '''
-        try:
-            with open(net_file, 'rt') as f:
-                # read first line for NumNets
-                nnet = int(f.readline().split()[1]) # net count
-                for line in f:
-                    # skip blank line, say line with '\n' only
-                    if not line.strip():
-                        continue
-                    line = line.split()
-                    if line[0] == 'NetDegree:':
-                        terminal_cnt = int(line[1])
-                        terminals = []
-                        for _ in range(terminal_cnt):
-                            term_name = f.readline().strip()
-                            if term_name in self.name_to_block:
-                                terminals.append(self.name_to_block[term_name])
-                            elif term_name in self.name_to_terminal:
-                                terminals.append(self.name_to_terminal[term_name])
-                            else:
-                                print('Error: found terminal/block not specified in block file',
-                                      file=sys.stderr)
-                                sys.exit()
-                        net = Net(terminals)
-                        self.nets.append(net)
-                    else:
-                        print('Error: in parsing net file', file=sys.stderr)
-                        sys.exit()
-                assert nnet == len(self.nets), 'Net number not equivalent'
-
-        except OSError as err:
-            sys.exit(err)
+        self.design.read_nets(net_file)
+        self._load_nets()
+
+    def load_design(self, dsgn):
+        '''Create blocks, terminals and nets of a parsed design.
+        '''
+        self.design = dsgn
+        self._load_blocks()
+        self._load_nets()
+
+    def _load_blocks(self):
+        '''Create blocks and terminals of self.design.
+        '''
+        dsgn = self.design
+        self.w_limit, self.h_limit = dsgn.w_limit, dsgn.h_limit
+        self.blocks = [Block(name=name, width=width, height=height) for name, width, height in
+                       zip(dsgn.names[:dsgn.nblock], dsgn.widths, dsgn.heights)]
+        self.name_to_block = {block.name: block for block in self.blocks}
+        self.terminals = [Terminal(name=name, x=x, y=y) for name, x, y in
+                          zip(dsgn.names[dsgn.nblock:], dsgn.term_x, dsgn.term_y)]
+        self.name_to_terminal = {terminal.name: terminal for terminal in self.terminals}
+        self.rotate_lst = [False for _ in range(len(self.blocks))]
+
+    def _load_nets(self):
+        '''Create nets of self.design reduced by netlist.preprocess(), connecting blocks by their
+        IDs and boxes of terminals.
+        '''
+        reduced = self.netlist = netlist.preprocess(self.design)
+        pin_idx = reduced.pin_idx
+        spans = list(zip(reduced.pin_ptr[:-1], reduced.pin_ptr[1:]))
+        self.nets = [Net([self.blocks[pin] for pin in pin_idx[start:end]], weight, box)
+                     for (start, end), weight, box in zip(spans, reduced.weights, reduced.boxes)]
+        self._net_blocks = [list(pin_idx[start:end]) for start, end in spans]
+        self._movable_nets = list(range(len(self.nets))) # every reduced net has blocks
 
     def calc_cost(self):
         '''Calculate cost considering both area and hpwl.
         '''
         width, height = self._calc_area()
         hpwl = self._calc_wire_len()
-        return self._calc_cost(width*height, hpwl)
+        return self._calc_cost(width*height, hpwl, normalize=False)
 
     def print_rpt(self, file_name='output.rpt'):
         '''Print floorplan result to file.
         '''
         width, height = self._calc_area()
         hpwl = self._calc_wire_len()
-        cost = self._calc_cost(width*height, hpwl)
+        cost = self._calc_cost(width*height, hpwl, normalize=False)
+        self._sync_blocks()
         with open(file_name, 'wt') as ofile:
             print(cost, file=ofile)
             print(hpwl, file=ofile)
             print(width*height, file=ofile)
             print('{} {}'.format(width, height), file=ofile)
-            print('{:.0f}'.format(time.time()-START_TIME), file=ofile)
+            print('{:.0f}'.format(self.scheduler.elapsed()), file=ofile)
             for block in self.blocks:
                 print('{0.name} {0.left_x} {0.bottom_y} {0.right_x} {0.top_y}'.format(block),
                       file=ofile)
 
-    def _calc_cost(self, area, wire_len):
+    def _calc_cost(self, area, wire_len, normalize=True):
         '''Calculate final cost considering both area and wire length.
+        If normalize and normalization is set, area and wire length are divided by their norms.
         '''
+        if normalize and self.area_norm is not None:
+            area = area / self.area_norm
+            wire_len = wire_len / self.wire_norm
         # if current floorplan is valid, return cost = alpha * area + (1-alpha) * hpwl
-        if self.is_valid:
+        if self.is_valid or self.cost_mode == 'penalty':
             return self.alpha * area + (1 - self.alpha) * wire_len
         else:
             return area
 
-    def _calc_area_cost(self):
-        '''Calculate area cost and take whether current floorplan from self.seq_pair can fit into
-        bounding box into consideration.
+    def _calc_area_cost(self, width, height):
+        '''Calculate area cost and take whether current floorplan of size width x height can fit
+        into bounding box into consideration.
         '''
-        width, height = self._calc_area()
         # # if current area is already valid
         # if width < self.w_limit and height < self.h_limit:
         #     return 0
         # return width*height
-        if self.is_valid:
+        if self.is_valid or self.cost_mode == 'penalty':
             return width * height
         else:
             width = self.h_limit if width < self.w_limit else width
             height = self.w_limit if height < self.h_limit else height
             return width * height
 
+    def _calc_penalty(self, width, height, normalize=True):
+        '''Calculate penalty of floorplan of size width x height exceeding outline, proportional to
+        excess width and height relative to outline, in unit of outline area, or 0 unless in
+        'penalty' cost mode.
+        If normalize and normalization is set, outline area is divided by its norm.
+        '''
+        if self.cost_mode != 'penalty':
+            return 0
+        excess = (max(width - self.w_limit, 0) / self.w_limit +
+                  max(height - self.h_limit, 0) / self.h_limit)
+        bbox_area = self.w_limit * self.h_limit
+        if normalize and self.area_norm is not None:
+            bbox_area = bbox_area / self.area_norm
+        return self.penalty * bbox_area * excess
+
+    def _calc_move_cost(self, width, height, wire_len):
+        '''Calculate cost of floorplan in annealing, including penalty of outline violation.
+        '''
+        return (self._calc_cost(self._calc_area_cost(width, height), wire_len) +
+                self._calc_penalty(width, height))
+
+    def _calc_refine_cost(self, width, height, wire_len):
+        '''Calculate cost of floorplan in refinement: reported cost, not normalized, plus penalty
+        of outline violation, so that refinement never makes the reported cost worse.
+        '''
+        return (self._calc_cost(width * height, wire_len, normalize=False) +
+                self._calc_penalty(width, height, normalize=False))
+
     def _calc_wire_len(self):
         '''Calculate cost in terms of area and wire length.
+        Only nets connecting blocks moved since last call are re-evaluated; HPWL of the others
+        is taken from cache.
         '''
-        hpwl = 0
-        for net in self.nets:
-            hpwl += net.calc_length()
-        return hpwl
+        if self.use_arrays and self.packer != 'graph':
+            return self._net_array.calc_wire_len(*self._block_array.centers())
+        if self._dirty_blocks is None or len(self._net_hpwl) != len(self.nets):
+            self._init_wire_len_cache()
+        else:
+            dirty_nets = set()
+            for blk_idx in self._dirty_blocks:
+                dirty_nets.update(self._block_nets[blk_idx])
+            for net_idx in dirty_nets:
+                hpwl = self.nets[net_idx].calc_length()
+                self._wire_len += hpwl - self._net_hpwl[net_idx]
+                self._net_hpwl[net_idx] = hpwl
+        self._dirty_blocks = set()
+        return self._wire_len
+
+    def _init_wire_len_cache(self):
+        '''Evaluate HPWL of every net, and build the index from block to its nets.
+        '''
+        self._block_nets = [[] for _ in self.blocks]
+        for net_idx, net_blocks in enumerate(self._net_blocks):
+            for blk in net_blocks:
+                self._block_nets[blk].append(net_idx)
+        self._net_hpwl = [net.calc_length() for net in self.nets]
+        self._wire_len = sum(self._net_hpwl) + self.netlist.offset
 
     def _set_block_rotation(self):
         '''Set rotation of each block based on self.rotate_lst
@@ -342,35 +1012,90 @@ class Floorplan:
             block.set_rotate(rotate)
 
     def _calc_area(self):
+        '''Pack blocks based on sequence pair to find out the size of floorplan.
+        Return (width, height).
+        '''
+        if self.packer == 'graph':
+            return self._calc_area_by_graph()
+        if self.use_arrays:
+            return self._calc_area_by_arrays()
+        # set rotation config of each block
+        self._set_block_rotation()
+
+        widths = [block.get_width() for block in self.blocks]
+        heights = [block.get_height() for block in self.blocks]
+        xs, ys, width, height = self.rep.pack(widths, heights)
+        dirty_blocks = self._dirty_blocks
+        for idx, block in enumerate(self.blocks):
+            x, y = xs[idx], ys[idx]
+            right_x, top_y = x + widths[idx], y + heights[idx]
+            if (block.left_x != x or block.bottom_y != y or
+                    block.right_x != right_x or block.top_y != top_y):
+                block.left_x = x
+                block.bottom_y = y
+                block.right_x = right_x
+                block.top_y = top_y
+                if dirty_blocks is not None:
+                    dirty_blocks.add(idx)
+        return width, height
+
+    def _calc_area_by_arrays(self):
+        '''Pack blocks as self._calc_area() does, but keep results in array-backed geometry.
+        Block objects are left untouched until self._sync_blocks().
+        '''
+        if self._block_array is None:
+            self._build_arrays()
+        block_array = self._block_array
+        block_array.set_rotation(self.rotate_lst)
+        xs, ys, width, height = self.rep.pack(block_array.widths.tolist(),
+                                                   block_array.heights.tolist())
+        block_array.set_coords(xs, ys)
+        return width, height
+
+    def _build_arrays(self):
+        '''Build array-backed geometry of blocks and nets.
+        '''
+        self._block_array = geometry.BlockArray(self.blocks)
+        self._net_array = geometry.NetArray(self.nets, self._block_array.names,
+                                            self.netlist.offset)
+
+    def _set_block_coords(self, xs, ys, widths, heights):
+        '''Set coordinates of blocks packed elsewhere, e.g. in batch, whose wire length has to be
+        evaluated from scratch next time.
+        '''
+        for block, x, y, width, height in zip(self.blocks, xs, ys, widths, heights):
+            block.left_x = x
+            block.bottom_y = y
+            block.right_x = x + width
+            block.top_y = y + height
+        if self._block_array is not None and self.use_arrays:
+            self._block_array.set_rotation(self.rotate_lst)
+            self._block_array.set_coords(xs, ys)
+        self._dirty_blocks = None
+
+    def _sync_blocks(self):
+        '''Write geometry in arrays back to Block objects.
+        '''
+        if self.use_arrays and self._block_array is not None:
+            self._block_array.sync_blocks(self.blocks)
+
+    def _calc_area_by_graph(self):
         '''Construct constraint graph, HCG and VCG based on sequence pair to find out the size of
         floorplan.
         Return (width, height).
         '''
+        self._dirty_blocks = None # every block may be moved
         # set rotation config of each block
         self._set_block_rotation()
 
-        hcg = graph.Hcg(self.blocks) # horizontal constraint graph
-        vcg = graph.Vcg(self.blocks) # vertical constraint graph
-        for pair in combinations(self.seq_pair[0], 2):
-            # print(pair)
-            if self.seq_pair[1].index(pair[0]) < self.seq_pair[1].index(pair[1]):
-                # horizontal constraint
-                # print('Block "{}" is to the left of block "{}"'.format(self.blocks[pair[0]].name,
-                #                                                        self.blocks[pair[1]].name))
-                # print('HCG: {} -> {}'.format(*pair))
-                hcg.connect(pair[0], pair[1])
-            elif self.seq_pair[1].index(pair[0]) > self.seq_pair[1].index(pair[1]):
-                # vertical constraint
-                # print('Block "{}" is below block "{}"'.format(self.blocks[pair[1]].name,
-                #                                                        self.blocks[pair[0]].name))
-                # print('VCG: {} -> {}'.format(*pair))
-                vcg.connect(pair[1], pair[0])
-            else:
-                assert self.seq_pair[1].index(pair[0]) != self.seq_pair[1].index(pair[1]), (
-                    'duplicate block index {} in sequence pair'.format(
-                        self.seq_pair[1].index(pair[0])))
-        hcg.connect_to_st()
-        vcg.connect_to_st()
+        pos_seq, neg_seq = self.rep.pos_seq, self.rep.neg_seq
+        if (self._graphs is not None and self._graphs[0] == pos_seq and
+                self._graphs[1] == neg_seq):
+            # only rotation changed, reuse graphs and their topological order
+            hcg, vcg = self._graphs[2:]
+        else:
+            hcg, vcg = graph.build_constraint_graphs(self.blocks, pos_seq, self.rep.neg_idx)
+            self._graphs = (pos_seq[:], neg_seq[:], hcg, vcg)
         weight = hcg.get_target_weight()
         height = vcg.get_target_weight()
         return weight, height
@@ -380,33 +1105,29 @@ class Floorplan:
         '''
         return width <= self.w_limit and height <= self.h_limit
 
-    def _initialize_seq_pair(self):
-        '''Initialize sequence pair (self.seq_pair) by shuffling it.
+    def _initialize_rep(self):
+        '''Initialize representation (self.rep) to the best of SHUFFLE_LIMIT random ones.
         '''
-        self.seq_pair = (list(range(len(self.blocks))), list(range(len(self.blocks))))
-        best_sol = copy.deepcopy(self.seq_pair)
-
+        self.rep = self.sample_reps(SHUFFLE_LIMIT, 1)[0][1]
         width, height = self._calc_area()
-        best_area = width * height
-        bbox_area = self.w_limit * self.h_limit
-        best_cost = self._calc_area_cost()
-        for _ in range(SHUFFLE_LIMIT):
-            shuffle(self.seq_pair[0])
-            shuffle(self.seq_pair[1])
-            new_width, new_height = self._calc_area()
-            new_area = new_width * new_height
-            new_cost = self._calc_area_cost()
-            # if new_area < 3.5 * bbox_area and new_area < best_area:
-            if new_cost < best_cost:
-                best_area = new_area
-                best_cost = new_cost
-                best_sol = copy.deepcopy(self.seq_pair)
-                print('Shuffle: {}x{}={:,}'.format(new_width, new_height, new_width*new_height))
-            else:
-                self.seq_pair = copy.deepcopy(best_sol)
-            if time.time() >= SHUFFLE_ABRT_TIME:
-                print('Shuffle terminated due to limit on time')
-                break
+        print('Shuffle: best {}x{}={:,}'.format(width, height, width*height))
+
+def _parse_move_weights(text):
+    '''Parse weights of moves given as MOVE=W,... in command line.
+    Return list of weights indexed by move type.
+    '''
+    weights = [1.0] * len(MOVE_NAMES)
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in MOVE_NAMES:
+            raise argparse.ArgumentTypeError('unknown move {}'.format(name))
+        try:
+            weights[MOVE_NAMES.index(name)] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid weight of move {}'.format(name))
+    if min(weights) < 0 or not any(weights):
+        raise argparse.ArgumentTypeError('weights must be non-negative, not all zero')
+    return weights
 
 def parse_cmd_line(argv):
     '''Parse the argumets in command line.
@@ -417,7 +1138,85 @@ def parse_cmd_line(argv):
     parser.add_argument('block_file', metavar='<input_block>', help='Input.block name')
     parser.add_argument('net_file', metavar='<input_net>', help='Input.net name')
     parser.add_argument('output_file', metavar='<output>', help='output name')
+    parser.add_argument('--engine', choices=list(ENGINES), default='seqpair',
+                        help='Representation of floorplan: sequence pair (default) or B*-tree '
+                        'packed along a contour')
+    parser.add_argument('--packer', choices=['lcs', 'graph'], default='lcs',
+                        help='Packing engine: LCS on sequence pair (default) or HCG/VCG')
+    parser.add_argument('--arrays', action='store_true',
+                        help='Evaluate with array-backed geometry and vectorized HPWL')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of annealing replicas run in parallel processes')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of random number generator, for reproducible runs')
+    parser.add_argument('--schedule', choices=sorted(schedule.SCHEDULES), default='classic',
+                        help='Annealing schedule: fixed geometric cooling (default) or Lam-style '
+                        'adaptive schedule on normalized cost')
+    parser.add_argument('--stats', action='store_true',
+                        help='Write telemetry to <output>.stats.json and <output>.steps.csv')
+    parser.add_argument('--move-weights', type=_parse_move_weights, default=None,
+                        metavar='MOVE=W,...',
+                        help='Weights of moves {}, 1 by default, 0 to disable a move'.format(
+                            ', '.join(MOVE_NAMES)))
+    parser.add_argument('--fixed-moves', action='store_true',
+                        help='Keep probabilities of moves at their weights, instead of adapting '
+                        'them to acceptance ratios')
+    parser.add_argument('--cost-mode', choices=COST_MODES, default='phased',
+                        help='Anneal area until floorplan fits into outline, then descend '
+                        'greedily (phased, default), or anneal cost plus penalty of outline '
+                        'violation throughout (penalty)')
+    parser.add_argument('--penalty', type=float, default=PENALTY_WEIGHT,
+                        help='Weight of outline violation relative to outline area in penalty '
+                        'cost mode (default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=1, metavar='K',
+                        help='Make K candidate moves per annealing step, evaluate them together '
+                        'by NumPy kernels, and accept the best by Metropolis criterion '
+                        '(default: 1, one move at a time)')
+    parser.add_argument('--multilevel', type=int, default=0, metavar='N',
+                        help='Cluster designs of more than N blocks into at most N super-blocks, '
+                        'anneal them, and uncoarsen level by level (default: 0, not to cluster)')
+    parser.add_argument('--critical-bias', type=float, default=0.0, metavar='P',
+                        help='Make swaps and rotations pick a critical block, one on a longest '
+                        'path of the dimension farther beyond outline, with probability P '
+                        '(default: 0, uniformly random blocks)')
+    parser.add_argument('--refine-window', type=int, default=REFINE_WINDOW,
+                        help='Max distance in positive sequence of blocks swapped in greedy '
+                        'refinement after annealing, 0 not to refine (default: %(default)s)')
+    parser.add_argument('--eval-cache', type=int, default=evalcache.DEFAULT_SIZE, metavar='N',
+                        help='Keep N recently evaluated floorplans, so that evaluating one again '
+                        'is a lookup; 0 not to cache (default: %(default)s)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory to cache parsed designs in, to skip parsing next time')
+    parser.add_argument('--checkpoint', default=None, metavar='FILE',
+                        help='Checkpoint annealing state to FILE periodically and at the end')
+    parser.add_argument('--checkpoint-interval', type=float, default=checkpoint.DEFAULT_INTERVAL,
+                        help='Seconds between checkpoints (default: %(default)s)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume annealing from checkpoint FILE')
+    parser.add_argument('--time-limit', type=float, default=scheduler.DEFAULT_BUDGET,
+                        help='Time budget of the run in seconds (default: %(default)s)')
     args = parser.parse_args(argv)
+    if args.resume and args.checkpoint is None:
+        parser.error('--resume requires --checkpoint')
+    if args.multilevel < 0 or args.multilevel == 1:
+        parser.error('--multilevel must be 0 or at least 2')
+    if args.checkpoint is not None and args.multilevel:
+        # levels are floorplans of other designs, whose annealing cannot be resumed
+        parser.error('--checkpoint cannot be combined with --multilevel')
+    if args.batch > 1 and batcheval.np is None:
+        parser.error('--batch requires NumPy')
+    if args.batch > 1 and (args.engine == 'bstar' or args.packer == 'graph'):
+        parser.error('--batch packs sequence pairs by LCS only')
+    if not 0 <= args.critical_bias <= 1:
+        parser.error('--critical-bias must be between 0 and 1')
+    if args.engine == 'bstar':
+        # packing by constraint graphs, checkpoints, clustering and slack work on sequence pairs
+        for option, value in (('--packer graph', args.packer == 'graph'),
+                              ('--checkpoint', args.checkpoint is not None),
+                              ('--multilevel', args.multilevel),
+                              ('--critical-bias', args.critical_bias)):
+            if value:
+                parser.error('--engine bstar cannot be combined with {}'.format(option))
     return args
 
 def main(argv):
@@ -425,12 +1224,45 @@ def main(argv):
     '''
     print('PDA PA3 - Fixed Outline Floorplanning')
     args = parse_cmd_line(argv)
-    flpr = Floorplan(args.alpha)
-    flpr.parse_block_file(args.block_file)
-    flpr.parse_net_file(args.net_file)
-    flpr.place_block()
+    sched = scheduler.Scheduler(args.time_limit)
+    if args.seed is not None:
+        random_seed(args.seed)
+    stats = telemetry.Telemetry(MOVE_NAMES) if args.stats else None
+    graph.set_stats(stats.graph if stats is not None else None)
+    flpr = Floorplan(args.alpha, args.packer, args.arrays, sched,
+                     schedule.SCHEDULES[args.schedule](), stats, args.engine)
+    try:
+        flpr.load_design(design.load(args.block_file, args.net_file, args.cache_dir))
+    except (OSError, design.ParseError) as err:
+        sys.exit(err)
+    nets = flpr.netlist
+    print('Nets: {:,} -> {:,} ({} merged, {} dropped), pins: {:,} -> {:,}, HPWL offset: {:,}'
+          .format(nets.nnet_orig, nets.nnet(), nets.nmerged, nets.ndropped, nets.npin_orig,
+                  nets.npin(), nets.offset))
+    resume = None
+    if args.resume:
+        try:
+            resume = checkpoint.load(args.checkpoint, flpr)
+        except checkpoint.CheckpointError as err:
+            sys.exit(err)
+    flpr.refine_window = args.refine_window
+    flpr.multilevel = args.multilevel
+    flpr.eval_cache_size = args.eval_cache
+    flpr.batch_size = args.batch
+    flpr.critical_bias = args.critical_bias
+    flpr.cost_mode = args.cost_mode
+    flpr.penalty = args.penalty
+    if args.move_weights is not None:
+        flpr.set_move_weights(args.move_weights)
+    flpr.adapt_moves = not args.fixed_moves
+    if args.checkpoint is not None:
+        flpr.checkpointer = checkpoint.Checkpointer(args.checkpoint, args.checkpoint_interval)
+    flpr.place_block(args.workers, args.seed, resume)
+    sched.finish()
     flpr.print_rpt(args.output_file)
+    if stats is not None:
+        stats.write(args.output_file, sched)
+    print('Elapsed time: {:.3f} secs\a'.format(sched.elapsed()))
 
 if __name__ == '__main__':
     main(sys.argv[1:])
-    print('Elapsed time: {:.3f} secs\a'.format(time.time()-START_TIME))
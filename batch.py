@@ -0,0 +1,160 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Batch mode, floorplanning many designs and alpha values in one process.
+
+A manifest lists jobs, one per line, as arguments of PA3.py: <alpha> <input_block> <input_net>
+<output>. Blank lines and lines starting with '#' are skipped. Each design is parsed once and
+sent once to each worker process of a pool, which runs jobs in turn, each with a time budget of
+its own. Reports of all jobs are written, and a summary table of them is printed.
+'''
+
+import argparse
+import contextlib
+import csv
+import io
+import random
+import shlex
+import sys
+from multiprocessing import Pool
+
+import design
+import PA3
+import schedule
+import scheduler
+
+SUMMARY_FIELDS = ['alpha', 'block_file', 'output', 'cost', 'hpwl', 'area', 'width', 'height',
+                  'valid', 'seconds']
+
+_DESIGNS = None # designs of worker process, keyed by (block_file, net_file)
+
+def parse_manifest(manifest_file):
+    '''Return list of jobs, (alpha, block_file, net_file, output), in manifest file.
+    Raise design.ParseError if a line is malformed.
+    '''
+    jobs = []
+    with open(manifest_file, 'rt') as ifile:
+        for lineno, line in enumerate(ifile, 1):
+            strs = shlex.split(line, comments=True)
+            if not strs:
+                continue
+            try:
+                if len(strs) != 4:
+                    raise ValueError('expected <alpha> <input_block> <input_net> <output>')
+                jobs.append((float(strs[0]), strs[1], strs[2], strs[3]))
+            except ValueError as err:
+                raise design.ParseError(manifest_file, lineno, err)
+    return jobs
+
+def load_designs(jobs, cache_dir=None):
+    '''Return dict of designs of jobs keyed by (block_file, net_file), each parsed once.
+    '''
+    designs = {}
+    for _, block_file, net_file, _ in jobs:
+        if (block_file, net_file) not in designs:
+            designs[block_file, net_file] = design.load(block_file, net_file, cache_dir)
+    return designs
+
+def run_job(designs, job, args, seed):
+    '''Floorplan a job with design in designs, write its report, and return its summary row.
+    '''
+    alpha, block_file, net_file, output = job
+    sched = scheduler.Scheduler(args.time_limit)
+    if seed is not None:
+        random.seed(seed)
+    flpr = PA3.Floorplan(alpha, args.packer, args.arrays, sched,
+                         schedule.SCHEDULES[args.schedule](), engine=args.engine)
+    flpr.load_design(designs[block_file, net_file])
+    with contextlib.redirect_stdout(io.StringIO()):
+        flpr.place_block(1, seed)
+    sched.finish()
+    flpr.print_rpt(output)
+    width, height = flpr._calc_area() # pylint: disable=W0212
+    return {'alpha': alpha, 'block_file': block_file, 'output': output,
+            'cost': flpr.calc_cost(), 'hpwl': flpr._calc_wire_len(), # pylint: disable=W0212
+            'area': width * height, 'width': width, 'height': height,
+            'valid': flpr._is_valid(width, height), # pylint: disable=W0212
+            'seconds': round(sched.elapsed(), 3)}
+
+def run_batch(jobs, designs, args):
+    '''Run jobs in a pool of args.workers processes.
+    Return summary rows of jobs, in order.
+    '''
+    tasks = [(job, args, None if args.seed is None else args.seed + idx)
+             for idx, job in enumerate(jobs)]
+    if args.workers <= 1:
+        return [run_job(designs, *task) for task in tasks]
+    with Pool(args.workers, initializer=_init_worker, initargs=(designs,)) as pool:
+        return pool.map(_run_job, tasks, chunksize=1)
+
+def print_summary(rows, ofile=sys.stdout):
+    '''Print summary table of jobs.
+    '''
+    print('{:>6} {:<24} {:<24} {:>14} {:>10} {:>12} {:>11} {:>5} {:>8}'.format(
+        'alpha', 'design', 'output', 'cost', 'hpwl', 'area', 'w x h', 'valid', 'secs'),
+          file=ofile)
+    for row in rows:
+        print('{alpha:>6g} {block_file:<24} {output:<24} {cost:>14,.1f} {hpwl:>10,} {area:>12,} '
+              '{size:>11} {valid!s:>5} {seconds:>8.3f}'.format(
+                  size='{}x{}'.format(row['width'], row['height']), **row), file=ofile)
+
+def _init_worker(designs):
+    '''Keep designs, sent once per worker process.
+    '''
+    global _DESIGNS # pylint: disable=W0603
+    _DESIGNS = designs
+
+def _run_job(task):
+    '''Run a job in worker process.
+    '''
+    return run_job(_DESIGNS, *task)
+
+def parse_cmd_line(argv):
+    '''Parse the argumets in command line.
+    '''
+    parser = argparse.ArgumentParser(description='PDA PA3 - Batch floorplanning')
+    parser.add_argument('manifest', metavar='<manifest>',
+                        help='File of jobs, one <alpha> <input_block> <input_net> <output> a line')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of jobs run in parallel processes')
+    parser.add_argument('--time-limit', type=float, default=scheduler.DEFAULT_BUDGET,
+                        help='Time budget of each job in seconds (default: %(default)s)')
+    parser.add_argument('--engine', choices=PA3.ENGINES, default='seqpair',
+                        help='Representation of floorplan: sequence pair (default) or B*-tree')
+    parser.add_argument('--packer', choices=['lcs', 'graph'], default='lcs',
+                        help='Packing engine: LCS on sequence pair (default) or HCG/VCG')
+    parser.add_argument('--arrays', action='store_true',
+                        help='Evaluate with array-backed geometry and vectorized HPWL')
+    parser.add_argument('--schedule', choices=sorted(schedule.SCHEDULES), default='classic',
+                        help='Annealing schedule')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of random number generator; job i is seeded by SEED + i')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory to cache parsed designs in, to skip parsing next time')
+    parser.add_argument('--summary', default=None, help='CSV file to write summary table to')
+    args = parser.parse_args(argv)
+    if args.engine == 'bstar' and args.packer == 'graph':
+        parser.error('--engine bstar cannot be combined with --packer graph')
+    return args
+
+def main(argv):
+    '''Main function.
+    '''
+    args = parse_cmd_line(argv)
+    try:
+        jobs = parse_manifest(args.manifest)
+        designs = load_designs(jobs, args.cache_dir)
+    except (OSError, design.ParseError) as err:
+        sys.exit(err)
+    print('{} jobs of {} designs'.format(len(jobs), len(designs)), flush=True)
+    rows = run_batch(jobs, designs, args)
+    print_summary(rows)
+    if args.summary is not None:
+        with open(args.summary, 'wt', newline='') as ofile:
+            writer = csv.DictWriter(ofile, SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Batched packing of candidate sequence pairs with NumPy.
+
+K candidates of the same blocks are packed together: the longest-path recurrence of packing is
+run over positions of positive sequence in lockstep for all candidates, each position a few
+array operations over K rows, so that interpreter overhead is paid once per position instead of
+once per candidate and block. Each position takes O(K n) work instead of the O(K log n) of the
+Fenwick tree in seqpair.py, which pays off for moderate n and enough candidates.
+NumPy is required.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def pack(pos_seqs, neg_seqs, widths, heights):
+    '''Pack K candidates, whose positive and negative sequences are rows of pos_seqs and neg_seqs,
+    and whose dimensions of block i are column i of widths and heights, all (K, n) arrays.
+    Return (xs, ys, width, height), where xs and ys are (K, n) arrays of left-x and bottom-y of
+    blocks, and width and height are (K,) arrays of size of floorplans.
+    '''
+    nrow, nblock = pos_seqs.shape
+    neg_idx = np.empty_like(neg_seqs)
+    neg_idx[np.arange(nrow)[:, None], neg_seqs] = np.arange(nblock)
+    xs = _longest_paths(pos_seqs, neg_idx, widths)
+    ys = _longest_paths(pos_seqs[:, ::-1], neg_idx, heights)
+    return xs, ys, (xs + widths).max(axis=1), (ys + heights).max(axis=1)
+
+def _longest_paths(orders, neg_idx, sizes):
+    '''Find the longest path to each block of each candidate, visiting blocks in order of rows of
+    orders. A block is preceded by every block visited earlier and placed before it in negative
+    sequence.
+    Return (K, n) array of coordinates.
+    '''
+    nrow, nblock = orders.shape
+    rows = np.arange(nrow)
+    cols = np.arange(nblock)
+    ends = np.zeros((nrow, nblock), dtype=sizes.dtype) # of visited blocks, by negative index
+    coords = np.zeros((nrow, nblock), dtype=sizes.dtype)
+    for blks in orders.T:
+        negs = neg_idx[rows, blks]
+        starts = np.where(cols < negs[:, None], ends, 0).max(axis=1)
+        coords[rows, blks] = starts
+        ends[rows, negs] = starts + sizes[rows, blks]
+    return coords
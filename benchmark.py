@@ -0,0 +1,266 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Benchmark harness with synthetic MCNC/GSRC-style floorplanning instances.
+
+Instances are generated deterministically from a seed in the format of block and net files read
+by Floorplan.parse_block_file() and Floorplan.parse_net_file(). Micro-benchmarks of packing and
+HPWL evaluation, and simulated-annealing with a fixed seed and move budget, are run on them, and
+moves/sec, final cost and peak memory are appended to a CSV results file, so that runs before
+and after a change are comparable.
+'''
+
+import argparse
+import contextlib
+import csv
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import geometry
+import PA3
+import scheduler
+
+GRAPH_LIMIT = 300 # max blocks to benchmark HCG/VCG packing, whose construction is quadratic
+RESULT_FIELDS = ['label', 'benchmark', 'nblock', 'nnet', 'ops', 'seconds', 'ops_per_sec',
+                 'final_cost', 'peak_kib']
+
+def generate(prefix, nblock, nterminal=None, nnet=None, avg_degree=3.0, max_degree=20,
+             aspect=1.0, whitespace=0.15, seed=0):
+    '''Write synthetic instance of nblock blocks to prefix.block and prefix.nets.
+    Outline has aspect ratio (height/width) aspect and whitespace ratio whitespace; terminals
+    lie on its boundary. Net degrees follow a geometric distribution of mean avg_degree.
+    Return (block_file, net_file).
+    '''
+    rng = random.Random(seed)
+    nterminal = nblock // 2 if nterminal is None else nterminal
+    nnet = nblock + nblock // 5 if nnet is None else nnet
+    blocks = []
+    for idx in range(nblock):
+        area = rng.uniform(400.0, 40000.0)
+        ratio = math.exp(rng.uniform(-1.0, 1.0)) # of height to width, within [1/e, e]
+        width = max(1, int(round(math.sqrt(area / ratio))))
+        height = max(1, int(round(area / width)))
+        blocks.append(('sb{}'.format(idx), width, height))
+    total_area = sum(width * height for _, width, height in blocks) * (1.0 + whitespace)
+    w_limit = int(math.ceil(math.sqrt(total_area / aspect)))
+    h_limit = int(math.ceil(total_area / w_limit))
+    terminals = []
+    for idx in range(nterminal):
+        # walk along the boundary of outline
+        pos = rng.uniform(0.0, 2.0 * (w_limit + h_limit))
+        if pos < w_limit:
+            x, y = pos, 0
+        elif pos < w_limit + h_limit:
+            x, y = w_limit, pos - w_limit
+        elif pos < 2*w_limit + h_limit:
+            x, y = pos - w_limit - h_limit, h_limit
+        else:
+            x, y = 0, pos - 2*w_limit - h_limit
+        terminals.append(('p{}'.format(idx + 1), int(x), int(y)))
+
+    block_file = prefix + '.block'
+    net_file = prefix + '.nets'
+    with open(block_file, 'wt') as ofile:
+        print('Outline: {} {}'.format(w_limit, h_limit), file=ofile)
+        print('NumBlocks: {}'.format(nblock), file=ofile)
+        print('NumTerminals: {}'.format(nterminal), file=ofile)
+        for block in blocks:
+            print('{} {} {}'.format(*block), file=ofile)
+        print(file=ofile)
+        for terminal in terminals:
+            print('{} terminal {} {}'.format(*terminal), file=ofile)
+    names = [block[0] for block in blocks] + [terminal[0] for terminal in terminals]
+    stop = 1.0 / max(avg_degree - 1.0, 1.0) # probability that a net gets no more pin
+    with open(net_file, 'wt') as ofile:
+        print('NumNets: {}'.format(nnet), file=ofile)
+        for _ in range(nnet):
+            degree = min(2, len(names))
+            while degree < min(max_degree, len(names)) and rng.random() > stop:
+                degree += 1
+            print('NetDegree: {}'.format(degree), file=ofile)
+            for name in rng.sample(names, degree):
+                print(name, file=ofile)
+    return block_file, net_file
+
+def load(block_file, net_file, alpha=0.5, **kwargs):
+    '''Return floorplan parsed from given files, with a random sequence pair, or B*-tree if
+    engine='bstar' is given.
+    '''
+    flpr = PA3.Floorplan(alpha, **kwargs)
+    flpr.parse_block_file(block_file)
+    flpr.parse_net_file(net_file)
+    flpr.rep = flpr._new_rep() # pylint: disable=W0212
+    flpr.rep.shuffle()
+    return flpr
+
+def bench_pack(flpr, nrep):
+    '''Pack nrep random sequence pairs.
+    Return number of packings done.
+    '''
+    for _ in range(nrep):
+        flpr.rep.shuffle()
+        flpr._calc_area() # pylint: disable=W0212
+    return nrep
+
+def bench_hpwl_full(flpr, nrep):
+    '''Evaluate HPWL of all nets nrep times.
+    Return number of evaluations done.
+    '''
+    flpr._calc_area() # pylint: disable=W0212
+    for _ in range(nrep):
+        flpr._init_wire_len_cache() # pylint: disable=W0212
+    return nrep
+
+def bench_hpwl_incremental(flpr, nrep):
+    '''Evaluate HPWL incrementally after nrep random moves, timing only the evaluations, not the
+    moves and packing before them.
+    Return (number of evaluations done, seconds taken by them).
+    '''
+    flpr._calc_area() # pylint: disable=W0212
+    flpr._calc_wire_len() # pylint: disable=W0212
+    seconds = 0.0
+    for _ in range(nrep):
+        flpr._perturb(random.randrange(len(PA3.MOVE_NAMES))) # pylint: disable=W0212
+        flpr._calc_area() # pylint: disable=W0212
+        begin = time.perf_counter()
+        flpr._calc_wire_len() # pylint: disable=W0212
+        seconds += time.perf_counter() - begin
+    return nrep, seconds
+
+def bench_hpwl_arrays(flpr, nrep):
+    '''Evaluate HPWL of all nets nrep times with array-backed geometry.
+    Return number of evaluations done.
+    '''
+    flpr.use_arrays = True
+    flpr._calc_area() # pylint: disable=W0212
+    for _ in range(nrep):
+        flpr._calc_wire_len() # pylint: disable=W0212
+    return nrep
+
+def bench_anneal(flpr, nmove):
+    '''Run simulated-annealing from current floorplan for nmove moves.
+    Return number of moves done.
+    '''
+    flpr.scheduler = scheduler.Scheduler(float('inf'))
+    flpr.scheduler.start_phase('anneal')
+    temp = flpr.init_schedule()
+    flpr.start_anneal()
+    uphill_lim, move_lim = flpr.schedule.step_limits(len(flpr.blocks))
+    done = 0
+    while done < nmove:
+        move_cnt, _, reject_cnt = flpr.anneal_at(temp, uphill_lim, min(move_lim, nmove - done))
+        done += move_cnt
+        temp = flpr.schedule.next_temp(temp, 1.0 - reject_cnt / move_cnt, done / nmove)
+    flpr.finish_anneal()
+    return done
+
+def run_benchmark(label, name, func, files, nop, seed, writer, **kwargs):
+    '''Run benchmark func(flpr, nop) on instance files with given seed, timing it, and again under
+    tracemalloc for peak memory. Write a row of results.
+    func returns number of operations done, or (number, seconds) if it times them itself.
+    '''
+    row = {}
+    for traced in (False, True):
+        random.seed(seed)
+        if traced:
+            tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            flpr = load(*files, **kwargs)
+            begin = time.perf_counter()
+            nop_done = func(flpr, nop)
+            seconds = time.perf_counter() - begin
+            if isinstance(nop_done, tuple):
+                nop_done, seconds = nop_done
+        if traced:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            row['peak_kib'] = round(peak / 1024)
+        else:
+            row.update({'label': label, 'benchmark': name, 'nblock': len(flpr.blocks),
+                        'nnet': len(flpr.nets), 'ops': nop_done, 'seconds': round(seconds, 6),
+                        'ops_per_sec': round(nop_done / seconds, 1) if seconds > 0 else 0.0,
+                        'final_cost': flpr.calc_cost() if name.startswith('anneal') else ''})
+    writer.writerow(row)
+    print('{benchmark:>16} n={nblock:<6} {ops_per_sec:>12,.1f} ops/s {final_cost:>14} '
+          '{peak_kib:>8} KiB'.format(**row), flush=True)
+
+def run(args):
+    '''Generate instances and run all benchmarks on them.
+    '''
+    workdir = args.dir if args.dir else tempfile.mkdtemp(prefix='pa3bench')
+    os.makedirs(workdir, exist_ok=True)
+    new_file = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+    with open(args.output, 'at', newline='') as ofile:
+        writer = csv.DictWriter(ofile, RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        for nblock in args.sizes:
+            files = generate(os.path.join(workdir, 'n{}'.format(nblock)), nblock,
+                             avg_degree=args.degree, aspect=args.aspect, seed=args.seed)
+            nrep = max(1, args.moves // 10)
+            run_benchmark(args.label, 'pack_lcs', bench_pack, files, nrep, args.seed, writer)
+            run_benchmark(args.label, 'pack_bstar', bench_pack, files, nrep, args.seed, writer,
+                          engine='bstar')
+            if nblock <= GRAPH_LIMIT:
+                run_benchmark(args.label, 'pack_graph', bench_pack, files, max(1, nrep // 10),
+                              args.seed, writer, packer='graph')
+            run_benchmark(args.label, 'hpwl_full', bench_hpwl_full, files, nrep, args.seed,
+                          writer)
+            run_benchmark(args.label, 'hpwl_incremental', bench_hpwl_incremental, files, nrep,
+                          args.seed, writer)
+            if geometry.np is not None:
+                run_benchmark(args.label, 'hpwl_arrays', bench_hpwl_arrays, files, nrep,
+                              args.seed, writer)
+            run_benchmark(args.label, 'anneal', bench_anneal, files, args.moves, args.seed,
+                          writer)
+            run_benchmark(args.label, 'anneal_bstar', bench_anneal, files, args.moves, args.seed,
+                          writer, engine='bstar')
+
+def parse_cmd_line(argv):
+    '''Parse the argumets in command line.
+    '''
+    parser = argparse.ArgumentParser(description='PDA PA3 - Floorplanning benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    for command in ('run', 'generate'):
+        sub = subparsers.add_parser(command, help=('Generate instances and run benchmarks'
+                                                   if command == 'run' else
+                                                   'Generate instances only'))
+        sub.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                         help='Numbers of blocks of instances')
+        sub.add_argument('--degree', type=float, default=3.0, help='Average net degree')
+        sub.add_argument('--aspect', type=float, default=1.0,
+                         help='Aspect ratio (height/width) of outline')
+        sub.add_argument('--seed', type=int, default=0, help='Seed of instances and runs')
+        sub.add_argument('--dir', default=None if command == 'run' else '.',
+                         help='Directory of instance files')
+        if command == 'run':
+            sub.add_argument('--moves', type=int, default=2000,
+                             help='Move budget of annealing; other benchmarks do a tenth')
+            sub.add_argument('--output', default='bench_results.csv',
+                             help='CSV file to append results to')
+            sub.add_argument('--label', default='', help='Label of this run in results')
+    return parser.parse_args(argv)
+
+def main(argv):
+    '''Main function.
+    '''
+    args = parse_cmd_line(argv)
+    if args.command == 'generate':
+        os.makedirs(args.dir, exist_ok=True)
+        for nblock in args.sizes:
+            files = generate(os.path.join(args.dir, 'n{}'.format(nblock)), nblock,
+                             avg_degree=args.degree, aspect=args.aspect, seed=args.seed)
+            print(' '.join(files))
+    else:
+        run(args)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
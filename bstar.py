@@ -0,0 +1,326 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+B*-tree representation of floorplans, with contour-based packing.
+
+A B*-tree is a binary tree of blocks, rooted at the block at the bottom-left corner. The left
+child of a block is placed right next to it, and the right child above it at the same left-x.
+Blocks are packed in preorder, each dropped onto a horizontal contour of blocks packed so far,
+which is kept as a linked list of segments. A block starts where a segment does: its left child
+at the segment after its top, and its right child at its top, which none of its left subtree
+covers. So the block takes over that segment as its top and unlinks those it covers, adding at
+most one segment, and packing takes amortized linear time.
+
+The tree lives in arrays indexed by node: a node holds a block, and node nblock is a sentinel,
+whose left child is the root, so that the root is linked as any other node. Perturbations
+journal every link they change, and are undone by replaying the journal backwards.
+'''
+
+import random
+
+from representation import INSERT, SWAP, Representation
+
+HASH_MASK = (1 << 64) - 1
+LEFT = 0 # link kinds
+RIGHT = 1
+PARENT = 2
+BLOCK = 3
+
+class TreeKeys:
+    '''Random keys of links and their values, hashing B*-trees of nblock blocks Zobrist-style:
+    each left, right and block link of a node adds the product of keys of the link and its value.
+    Parent links follow from child links and are not hashed.
+    '''
+    def __init__(self, nblock, seed=0):
+        rng = random.Random(seed)
+        self.link_keys = [[rng.getrandbits(64) for _ in range(nblock + 1)] if kind != PARENT
+                          else None for kind in (LEFT, RIGHT, PARENT, BLOCK)]
+        self.value_keys = [rng.getrandbits(64) for _ in range(nblock + 1)] # of -1 to nblock-1
+
+    def hash(self, tree):
+        '''Return hash of B*-tree.
+        '''
+        total = 0
+        value_keys = self.value_keys
+        for kind in (LEFT, RIGHT, BLOCK):
+            link_keys = self.link_keys[kind]
+            total += sum(link_keys[node] * value_keys[value + 1]
+                         for node, value in enumerate(tree.links[kind]))
+        return total & HASH_MASK
+
+class BStarTree(Representation):
+    '''B*-tree of nblock blocks, initially a complete binary tree of blocks in order. A tree has
+    no parts, so all moves change all of it.
+    '''
+    def __init__(self, nblock):
+        self.nblock = nblock
+        left = [2*node + 1 if 2*node + 1 < nblock else -1 for node in range(nblock)] + [0]
+        right = [2*node + 2 if 2*node + 2 < nblock else -1 for node in range(nblock)] + [-1]
+        parent = [(node - 1) // 2 for node in range(nblock)] + [-1]
+        if nblock > 0:
+            parent[0] = nblock
+        # links of each node, indexed by link kind: children, parent, and block held by it
+        self.links = [left, right, parent, list(range(nblock)) + [-1]]
+        self.node_of = list(range(nblock)) # block -> node holding it
+        self.keys = None # TreeKeys, or None not to hash
+        self.hash = 0
+        self._journal = None # changed links, (kind, node, old value), while perturbing
+
+    def __getstate__(self):
+        '''Pickle without keys, which the receiver sets again.
+        '''
+        state = self.__dict__.copy()
+        state['keys'] = None
+        state['hash'] = 0
+        return state
+
+    @classmethod
+    def initial(cls, nblock):
+        '''Return complete binary tree of nblock blocks in order.
+        '''
+        return cls(nblock)
+
+    @staticmethod
+    def new_keys(nblock):
+        '''Return TreeKeys hashing B*-trees of nblock blocks.
+        '''
+        return TreeKeys(nblock)
+
+    def set_keys(self, keys):
+        '''Hash this tree by given TreeKeys from now on.
+        '''
+        self.keys = keys
+        self.hash = keys.hash(self)
+
+    def swap_blocks(self, blk0, blk1):
+        '''Swap nodes of two blocks. swap_blocks(blk0, blk1) again undoes it.
+        '''
+        node0, node1 = self.node_of[blk0], self.node_of[blk1]
+        self._set(BLOCK, node0, blk1)
+        self._set(BLOCK, node1, blk0)
+
+    def move_block(self, blk, target, side):
+        '''Remove block from tree and insert it as child of block target on given side, LEFT or
+        RIGHT, the former child becoming its child on the same side.
+        Return journal of the move, with which unwind() restores the tree.
+        '''
+        self._journal = journal = []
+        left, right, parent, _ = self.links
+        node = self.node_of[blk]
+        # sink the block until its node has at most one child, and splice the node out
+        while left[node] >= 0 and right[node] >= 0:
+            child = left[node]
+            self.swap_blocks(blk, self.links[BLOCK][child])
+            node = child
+        child = left[node] if left[node] >= 0 else right[node]
+        self._link(parent[node], LEFT if left[parent[node]] == node else RIGHT, child)
+        self._set(LEFT, node, -1)
+        self._set(RIGHT, node, -1)
+        # reuse the node for the block under target
+        target_node = self.node_of[target]
+        child = self.links[side][target_node]
+        self._link(target_node, side, node)
+        self._link(node, side, child)
+        self._journal = None
+        return journal
+
+    def unwind(self, journal):
+        '''Restore tree perturbed by move_block() of given journal.
+        '''
+        for kind, node, value in reversed(journal):
+            self._set(kind, node, value)
+
+    def swap(self, blk0, blk1, both=True):
+        '''Swap nodes of two blocks.
+        Return undo record of the move.
+        '''
+        self.swap_blocks(blk0, blk1)
+        return (True, SWAP, blk0, blk1)
+
+    def insert(self, blk, target, side, both=True):
+        '''Move block blk to child of block target on given side, to its right or above it.
+        Return undo record of the move.
+        '''
+        return (True, INSERT, blk, target, side, self.move_block(blk, target, side))
+
+    def undo(self, record):
+        '''Restore tree perturbed by the move of given undo record.
+        '''
+        if record[1] == SWAP:
+            self.swap_blocks(record[2], record[3]) # involution
+        else:
+            self.unwind(record[5])
+
+    def redo(self, record):
+        '''Make the move of given undo record again after undo() restored it. The move is made
+        on the same tree again, so the journal of the record still undoes it.
+        '''
+        if record[1] == SWAP:
+            self.swap_blocks(record[2], record[3])
+        else:
+            self.move_block(*record[2:5])
+
+    def neighborhood(self, window):
+        '''Generate undo records of swaps of blocks at most window apart in preorder, without
+        making them; swaps leave the preorder of nodes unchanged.
+        '''
+        nblock = self.nblock
+        nodes = self.preorder()
+        blocks = self.links[BLOCK]
+        for idx in range(nblock):
+            for other in range(idx + 1, min(idx + 1 + window, nblock)):
+                yield (True, SWAP, blocks[nodes[idx]], blocks[nodes[other]])
+
+    def preorder(self):
+        '''Return nodes in preorder, the order of packing.
+        '''
+        left, right = self.links[LEFT], self.links[RIGHT]
+        order = []
+        stack = [left[self.nblock]] if self.nblock > 0 else []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if right[node] >= 0:
+                stack.append(right[node])
+            if left[node] >= 0:
+                stack.append(left[node])
+        return order
+
+    def shuffle(self):
+        '''Build a random tree of blocks in random order.
+        '''
+        nblock = self.nblock
+        left = [-1] * (nblock + 1)
+        right = [-1] * (nblock + 1)
+        parent = [-1] * (nblock + 1)
+        if nblock > 0:
+            left[nblock] = 0
+            parent[0] = nblock
+        slots = [(0, LEFT), (0, RIGHT)] # free child slots
+        children = (left, right)
+        for node in range(1, nblock):
+            idx = random.randrange(len(slots))
+            par, side = slots[idx]
+            slots[idx] = slots[-1]
+            slots.pop()
+            children[side][par] = node
+            parent[node] = par
+            slots.append((node, LEFT))
+            slots.append((node, RIGHT))
+        blocks = list(range(nblock))
+        random.shuffle(blocks)
+        self.links = [left, right, parent, blocks + [-1]]
+        self.node_of = _inverse(blocks)
+        if self.keys is not None:
+            self.hash = self.keys.hash(self)
+
+    def copy(self):
+        '''Return a copy of this tree.
+        '''
+        tree = BStarTree.__new__(BStarTree)
+        tree.nblock = self.nblock
+        tree.links = [links[:] for links in self.links]
+        tree.node_of = self.node_of[:]
+        tree.keys = self.keys
+        tree.hash = self.hash
+        tree._journal = None # pylint: disable=W0212
+        return tree
+
+    def assign(self, other):
+        '''Make this tree the same as other one in place.
+        '''
+        for links, other_links in zip(self.links, other.links):
+            links[:] = other_links
+        self.node_of[:] = other.node_of
+        if self.keys is not None:
+            self.hash = other.hash if other.keys is self.keys else self.keys.hash(self)
+
+    def pack(self, widths, heights):
+        '''Pack blocks placed by this tree.
+        widths[i] and heights[i] are the dimension of block i.
+        Return (xs, ys, width, height), where xs[i] and ys[i] are left-x and bottom-y of block i.
+        '''
+        nblock = self.nblock
+        left, right, _, blocks = self.links
+        xs = [0] * nblock
+        ys = [0] * nblock
+        width = 0
+        height = 0
+        # contour: linked list of segments, segment i spanning from seg_xs[i] to the start of
+        # the next one, seg_next[i], or to infinity if it is -1, at seg_ys[i]
+        seg_xs = [0]
+        seg_ys = [0]
+        seg_next = [-1]
+        stack = [(left[nblock], 0)] if nblock > 0 else [] # (node, segment starting at left-x)
+        while stack:
+            node, seg = stack.pop()
+            blk = blocks[node]
+            x = seg_xs[seg]
+            x_end = x + widths[blk]
+            # segments covered by the block are unlinked, and the last one may be cut short
+            y = seg_ys[seg]
+            last = seg
+            after = seg_next[seg]
+            while after >= 0 and seg_xs[after] < x_end:
+                last = after
+                if seg_ys[after] > y:
+                    y = seg_ys[after]
+                after = seg_next[after]
+            if after < 0 or seg_xs[after] > x_end:
+                if last == seg:
+                    seg_xs.append(x_end)
+                    seg_ys.append(seg_ys[seg])
+                    seg_next.append(after)
+                    after = len(seg_xs) - 1
+                else:
+                    seg_xs[last] = x_end
+                    after = last
+            # the segment becomes top of the block
+            seg_next[seg] = after
+            top = y + heights[blk]
+            seg_ys[seg] = top
+            xs[blk] = x
+            ys[blk] = y
+            if x_end > width:
+                width = x_end
+            if top > height:
+                height = top
+            if right[node] >= 0:
+                stack.append((right[node], seg))
+            if left[node] >= 0:
+                stack.append((left[node], after))
+        return xs, ys, width, height
+
+    def _set(self, kind, node, value):
+        '''Set link of given kind of node to value, journaling and hashing the change.
+        '''
+        links = self.links[kind]
+        if self._journal is not None:
+            self._journal.append((kind, node, links[node]))
+        if self.keys is not None and kind != PARENT:
+            value_keys = self.keys.value_keys
+            self.hash = (self.hash + self.keys.link_keys[kind][node] *
+                         (value_keys[value + 1] - value_keys[links[node] + 1])) & HASH_MASK
+        links[node] = value
+        if kind == BLOCK and value >= 0:
+            self.node_of[value] = node
+
+    def _link(self, node, side, child):
+        '''Make child, or none if -1, the child of node on given side.
+        '''
+        self._set(side, node, child)
+        if child >= 0:
+            self._set(PARENT, child, node)
+
+    def __eq__(self, other):
+        return self.links == other.links
+
+    def __repr__(self):
+        return 'BStarTree({})'.format(self.links)
+
+def _inverse(blocks):
+    '''Return list mapping each block to its node.
+    '''
+    nodes = [0] * len(blocks)
+    for node, blk in enumerate(blocks):
+        nodes[blk] = node
+    return nodes
@@ -0,0 +1,91 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Checkpoint of annealing state, so that a run killed midway can be resumed.
+
+A checkpoint keeps current and best floorplans, i.e. sequence pairs and rotation of blocks,
+temperature, schedule and progress of annealing, normalization of cost, adapted probabilities
+of moves, state of random generator and telemetry, pickled into a compact file. Costs are not
+kept but evaluated again on resume, so that a checkpoint also warm-starts a run with another
+alpha.
+'''
+
+import os
+import pickle
+import random
+import time
+from array import array
+
+VERSION = 4 # bump when state changes, to reject old checkpoints
+DEFAULT_INTERVAL = 30.0 # seconds between checkpoints
+
+class CheckpointError(Exception):
+    '''Checkpoint unreadable or not of the design.
+    '''
+
+class Checkpointer:
+    '''Periodic checkpointing of a run to a file.
+    '''
+    def __init__(self, file_name, interval=DEFAULT_INTERVAL):
+        self.file_name = file_name
+        self.interval = interval
+        self._last_save = time.time()
+
+    def maybe_save(self, flpr, temp, rng_state=None):
+        '''Save checkpoint if interval has elapsed since last one.
+        '''
+        if time.time() - self._last_save >= self.interval:
+            self.save(flpr, temp, rng_state)
+
+    def save(self, flpr, temp, rng_state=None):
+        '''Save checkpoint of floorplan annealed at temperature temp.
+        rng_state is that of random module if not given.
+        '''
+        save(self.file_name, flpr, temp, rng_state)
+        self._last_save = time.time()
+
+def save(file_name, flpr, temp, rng_state=None):
+    '''Save checkpoint of floorplan annealed at temperature temp to file.
+    rng_state is that of random module if not given.
+    '''
+    state = {
+        'version': VERSION,
+        'blocks': [block.name for block in flpr.blocks],
+        'seq_pair': (array('i', flpr.rep.pos_seq), array('i', flpr.rep.neg_seq)),
+        'rotate_lst': bytes(flpr.rotate_lst),
+        'is_valid': flpr.is_valid,
+        'best_sol': (array('i', flpr.best_sol.pos_seq), array('i', flpr.best_sol.neg_seq)),
+        'best_rotate': bytes(flpr.best_rotate),
+        'temp': temp,
+        'schedule': type(flpr.schedule).__name__,
+        'progress': flpr.anneal_progress(),
+        'norms': (flpr.area_norm, flpr.wire_norm),
+        'move_probs': flpr.move_probs,
+        'rng_state': random.getstate() if rng_state is None else rng_state,
+        'telemetry': flpr.telemetry,
+    }
+    tmp_file = '{}.{}.tmp'.format(file_name, os.getpid())
+    with open(tmp_file, 'wb') as ofile:
+        pickle.dump(state, ofile, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, file_name) # so that a run killed while saving keeps the last one
+
+def load(file_name, flpr):
+    '''Return state of checkpoint in file, checked against blocks and schedule of floorplan,
+    which decides normalization of cost.
+    Raise CheckpointError if it cannot be resumed.
+    '''
+    try:
+        with open(file_name, 'rb') as ifile:
+            state = pickle.load(ifile)
+    except (OSError, EOFError, pickle.UnpicklingError) as err:
+        raise CheckpointError('{}: {}'.format(file_name, err))
+    if not isinstance(state, dict) or state.get('version') != VERSION:
+        raise CheckpointError('{}: not a checkpoint of version {}'.format(file_name, VERSION))
+    if state['blocks'] != [block.name for block in flpr.blocks]:
+        raise CheckpointError('{}: checkpoint of another design'.format(file_name))
+    if state['schedule'] != type(flpr.schedule).__name__:
+        raise CheckpointError('{}: checkpoint of schedule {}, not {}'.format(
+            file_name, state['schedule'], type(flpr.schedule).__name__))
+    if (state['norms'][0] is None) == flpr.schedule.adaptive:
+        raise CheckpointError('{}: normalization of cost does not match schedule'.format(
+            file_name))
+    return state
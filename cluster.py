@@ -0,0 +1,218 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Multilevel floorplanning of designs with many blocks.
+
+Blocks strongly connected by nets are paired into super-blocks by heavy-edge matching, level by
+level, until the design is small enough. A super-block packs its pair side by side or stacked,
+whichever is tighter, and is rotated as a whole; super-blocks are hard, of fixed shape. The
+coarsest design is annealed in a share of time, and then each level is uncoarsened by expanding
+super-blocks in the sequence pair, which never enlarges the packing, and annealed again in a
+share of remaining time in proportion to its blocks: reheated to a temperature at which few
+uphill moves are accepted, and cooled geometrically in time down to the final temperature of
+the coarsest level. The original design is refined last.
+'''
+
+import math
+import random
+from array import array
+from time import perf_counter
+
+import design
+import seqpair
+
+MAX_NET_DEGREE = 10 # nets of more blocks are ignored in matching
+MAX_AREA_RATIO = 3.0 # max area of a super-block relative to average area of blocks of a level
+MIN_SHRINK = 0.9 # coarsening stops when a level would keep more than this share of blocks
+COARSE_SHARE = 0.5 # share of time after initialization to anneal the coarsest level
+UNCOARSEN_ACCEPT = 0.05 # probability of accepting an average uphill move when reheating a level
+UNCOARSEN_SAMPLES = 200 # moves sampled to estimate temperature of reheating
+UNCOARSEN_STEP = 2 # moves per block of a temperature step of uncoarsening
+MIN_TEMP_RATIO = 0.01 # max ratio of final to initial temperature of uncoarsening
+
+class Level:
+    '''A clustered design, and how each of its blocks expands into blocks of the finer design.
+    clusters[i] is (blk,) for a block kept as is, or (blk0, blk1, stacked, rotated0, rotated1)
+    for a super-block of blk0 to the left of blk1, or below it if stacked, rotated as given.
+    '''
+    def __init__(self, dsgn, clusters):
+        self.design = dsgn
+        self.clusters = clusters
+
+def coarsen(dsgn, rng):
+    '''Pair blocks of design by heavy-edge matching.
+    Return Level of the clustered design.
+    '''
+    nblock = dsgn.nblock
+    areas = [width * height for width, height in zip(dsgn.widths, dsgn.heights)]
+    # connectivity of blocks, each net of k blocks adding 1/(k-1) to each pair of them
+    weights = [{} for _ in range(nblock)]
+    for start, end in zip(dsgn.pin_ptr[:-1], dsgn.pin_ptr[1:]):
+        blks = sorted({pin for pin in dsgn.pin_idx[start:end] if pin < nblock})
+        if not 2 <= len(blks) <= MAX_NET_DEGREE:
+            continue
+        weight = 1.0 / (len(blks) - 1)
+        for idx, blk0 in enumerate(blks):
+            for blk1 in blks[idx+1:]:
+                weights[blk0][blk1] = weights[blk0].get(blk1, 0.0) + weight
+                weights[blk1][blk0] = weights[blk1].get(blk0, 0.0) + weight
+
+    # visit small blocks first, so that they are absorbed before large ones
+    max_area = MAX_AREA_RATIO * sum(areas) / nblock
+    order = list(range(nblock))
+    rng.shuffle(order)
+    order.sort(key=areas.__getitem__)
+    mates = [-1] * nblock
+    for blk in order:
+        if mates[blk] >= 0:
+            continue
+        best, best_rating = -1, 0.0
+        for other, weight in weights[blk].items():
+            area = areas[blk] + areas[other]
+            if mates[other] < 0 and area <= max_area and weight / area > best_rating:
+                best, best_rating = other, weight / area
+        if best >= 0:
+            mates[blk], mates[best] = best, blk
+
+    coarse = design.Design()
+    coarse.w_limit, coarse.h_limit = dsgn.w_limit, dsgn.h_limit
+    clusters = []
+    names = []
+    cluster_of = [0] * nblock
+    for blk in range(nblock):
+        mate = mates[blk]
+        if mate < 0:
+            clusters.append((blk,))
+            names.append(dsgn.names[blk])
+            coarse.widths.append(dsgn.widths[blk])
+            coarse.heights.append(dsgn.heights[blk])
+        elif blk < mate:
+            width, height, stacked, rotated = _pair_shape(dsgn.widths[blk], dsgn.heights[blk],
+                                                          dsgn.widths[mate], dsgn.heights[mate])
+            clusters.append((blk, mate, stacked, False, rotated))
+            names.append('{}+{}'.format(dsgn.names[blk], dsgn.names[mate]))
+            coarse.widths.append(width)
+            coarse.heights.append(height)
+        else:
+            continue
+        cluster_of[blk] = cluster_of[mate] = len(clusters) - 1
+    coarse.nblock = len(clusters)
+    coarse.names = names + dsgn.names[nblock:]
+    coarse.name_to_id = {name: idx for idx, name in enumerate(coarse.names)}
+    coarse.term_x = array('l', dsgn.term_x)
+    coarse.term_y = array('l', dsgn.term_y)
+    # nets on clustered blocks, without those inside a super-block
+    offset = nblock - coarse.nblock
+    for start, end in zip(dsgn.pin_ptr[:-1], dsgn.pin_ptr[1:]):
+        pins = dict.fromkeys(cluster_of[pin] if pin < nblock else pin - offset
+                             for pin in dsgn.pin_idx[start:end])
+        if len(pins) >= 2:
+            coarse.pin_idx.extend(pins)
+            coarse.pin_ptr.append(len(coarse.pin_idx))
+    return Level(coarse, clusters)
+
+def build_levels(dsgn, max_blocks, rng):
+    '''Coarsen design level by level until it has at most max_blocks blocks, or stops shrinking.
+    Return list of Levels, finest first.
+    '''
+    levels = []
+    while dsgn.nblock > max_blocks:
+        level = coarsen(dsgn, rng)
+        if level.design.nblock > MIN_SHRINK * dsgn.nblock:
+            break
+        levels.append(level)
+        dsgn = level.design
+    return levels
+
+def expand(seq_pair, rotate_lst, clusters):
+    '''Expand super-blocks of a clustered floorplan given by seq_pair and rotate_lst.
+    Return (seq_pair, rotate_lst) of the finer floorplan.
+    '''
+    pos_seq = []
+    neg_seq = []
+    for blk in seq_pair.pos_seq:
+        cluster = clusters[blk]
+        if len(cluster) > 1 and cluster[2] != rotate_lst[blk]:
+            # stacked after rotation of super-block, blk1 above blk0
+            pos_seq.extend((cluster[1], cluster[0]))
+        else:
+            pos_seq.extend(cluster[:2])
+    for blk in seq_pair.neg_seq:
+        neg_seq.extend(clusters[blk][:2])
+    fine_rotate = [False] * len(pos_seq)
+    for blk, cluster in enumerate(clusters):
+        if len(cluster) == 1:
+            fine_rotate[cluster[0]] = rotate_lst[blk]
+        else:
+            fine_rotate[cluster[0]] = cluster[3] != rotate_lst[blk]
+            fine_rotate[cluster[1]] = cluster[4] != rotate_lst[blk]
+    return seqpair.SequencePair(pos_seq, neg_seq), fine_rotate
+
+def place_block(flpr, nworker, seed, max_blocks):
+    '''Do multilevel floorplanning of flpr, clustering it into at most max_blocks blocks.
+    Return False if the design cannot be clustered, and is left unplaced.
+    '''
+    levels = build_levels(flpr.design, max(max_blocks, 2), random.Random(seed))
+    if not levels:
+        return False
+    designs = [flpr.design] + [level.design for level in levels] # finest first
+    print('Multilevel: {} blocks clustered into {} in {} levels'.format(
+        designs[0].nblock, designs[-1].nblock, len(levels)), flush=True)
+    coarse = flpr.derive(designs[-1])
+    coarse.refine_window = 0
+    coarse.anneal_share = COARSE_SHARE
+    coarse.place_block(nworker, seed)
+
+    cur = coarse
+    for idx in reversed(range(len(levels))):
+        if idx > 0:
+            fine = flpr.derive(designs[idx])
+            fine.refine_window = 0
+        else:
+            fine = flpr
+        fine.rep, fine.rotate_lst = expand(cur.rep, cur.rotate_lst, levels[idx].clusters)
+        fine.is_valid = cur.best_is_valid
+        fine.area_norm, fine.wire_norm = coarse.area_norm, coarse.wire_norm
+        # remaining time is split among levels in proportion to their blocks, and the last
+        # level leaves time for refinement
+        if idx > 0:
+            fine.scheduler.start_phase('uncoarsen', share=designs[idx].nblock / sum(
+                dsgn.nblock for dsgn in designs[:idx+1]))
+        else:
+            fine.scheduler.start_phase('uncoarsen', flpr.refine_reserve())
+        print('Uncoarsen to {} blocks'.format(len(fine.blocks)), flush=True)
+        _anneal_level(fine, coarse.final_temp)
+        cur = fine
+    flpr.refine()
+    return True
+
+def _anneal_level(flpr, final_temp):
+    '''Anneal floorplan until time of current phase is up, cooling geometrically in time from a
+    temperature at which an average uphill move is accepted with probability UNCOARSEN_ACCEPT
+    down to final_temp, and restore the best floorplan.
+    '''
+    deltas = flpr.sample_uphill(UNCOARSEN_SAMPLES)
+    start_temp = (-(sum(deltas) / len(deltas)) / math.log(UNCOARSEN_ACCEPT) if deltas else
+                  final_temp)
+    end_temp = min(final_temp, MIN_TEMP_RATIO * start_temp)
+    flpr.start_anneal()
+    move_lim = UNCOARSEN_STEP * len(flpr.blocks)
+    while not flpr.scheduler.time_up():
+        temp = start_temp * (end_temp / start_temp) ** flpr.scheduler.progress()
+        step_start = perf_counter()
+        move_cnt, uphill, reject_cnt = flpr.anneal_at(temp, move_lim, move_lim)
+        if flpr.telemetry is not None:
+            flpr.telemetry.record_step(temp, move_cnt, uphill, reject_cnt,
+                                       perf_counter() - step_start)
+    flpr.finish_anneal()
+
+def _pair_shape(width0, height0, width1, height1):
+    '''Return (width, height, stacked, rotated) of the tightest super-block of two blocks, placed
+    side by side or stacked, the second one possibly rotated.
+    '''
+    shapes = []
+    for rotated in (False, True):
+        if rotated:
+            width1, height1 = height1, width1
+        shapes.append((width0 + width1, max(height0, height1), False, rotated))
+        shapes.append((max(width0, width1), height0 + height1, True, rotated))
+    return min(shapes, key=lambda shape: (shape[0] * shape[1], abs(shape[0] - shape[1])))
@@ -0,0 +1,191 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Bulk parser of block and net files into a design, whose names are interned to integer IDs.
+
+Each file is read into memory at once and split into tokens, instead of line by line; line
+numbers are recovered from the text only to report errors. Block i has ID i, and terminal i
+has ID nblock + i. Pins of net i are pin_idx[pin_ptr[i]:pin_ptr[i+1]], compressed sparse rows
+(CSR) of IDs built while parsing. A parsed design can be cached in binary, keyed by path, size
+and modification time of input files, so that repeated runs on the same inputs skip parsing.
+'''
+
+import hashlib
+import os
+import pickle
+import sys
+from array import array
+
+CACHE_VERSION = 1 # bump when Design changes, to invalidate cached designs
+
+class ParseError(Exception):
+    '''Malformed block or net file.
+    '''
+    def __init__(self, file_name, lineno, msg):
+        Exception.__init__(self, '{}:{}: {}'.format(file_name, lineno, msg))
+        self.file_name = file_name
+        self.lineno = lineno
+
+class Design:
+    '''Outline, blocks, terminals and nets of a floorplanning problem.
+    '''
+    def __init__(self):
+        self.w_limit = -1
+        self.h_limit = -1
+        self.names = [] # of blocks, then of terminals, indexed by ID
+        self.name_to_id = {}
+        self.nblock = 0
+        self.widths = array('l') # of blocks
+        self.heights = array('l')
+        self.term_x = array('l') # of terminals
+        self.term_y = array('l')
+        self.pin_ptr = array('l', [0])
+        self.pin_idx = array('l')
+
+    def nterminal(self):
+        '''Return number of terminals.
+        '''
+        return len(self.names) - self.nblock
+
+    def nnet(self):
+        '''Return number of nets.
+        '''
+        return len(self.pin_ptr) - 1
+
+    def read_blocks(self, block_file):
+        '''Parse block file.
+        '''
+        text, strs = _read_tokens(block_file)
+        self.w_limit, self.h_limit = _read_header(block_file, text, strs, 0, 'Outline:', 2)
+        nblock, = _read_header(block_file, text, strs, 3, 'NumBlocks:', 1)
+        nterminal, = _read_header(block_file, text, strs, 5, 'NumTerminals:', 1)
+        block_names = []
+        terminal_names = []
+        pos = 7
+        while pos < len(strs):
+            if pos + 3 < len(strs) and strs[pos+1] == 'terminal':
+                terminal_names.append(strs[pos])
+                self.term_x.append(_to_int(block_file, text, strs, pos + 2))
+                self.term_y.append(_to_int(block_file, text, strs, pos + 3))
+                pos += 4
+            elif pos + 2 < len(strs):
+                block_names.append(strs[pos])
+                self.widths.append(_to_int(block_file, text, strs, pos + 1))
+                self.heights.append(_to_int(block_file, text, strs, pos + 2))
+                pos += 3
+            else:
+                raise ParseError(block_file, _lineno(text, pos), 'expected block or terminal')
+        if len(block_names) != nblock:
+            raise ParseError(block_file, _lineno(text, pos),
+                             'expected {} blocks, found {}'.format(nblock, len(block_names)))
+        if len(terminal_names) != nterminal:
+            raise ParseError(block_file, _lineno(text, pos), 'expected {} terminals, found {}'
+                             .format(nterminal, len(terminal_names)))
+        self.nblock = nblock
+        self.names = [sys.intern(name) for name in block_names + terminal_names]
+        self.name_to_id = {name: idx for idx, name in enumerate(self.names)}
+        if len(self.name_to_id) != len(self.names):
+            raise ParseError(block_file, _lineno(text, pos), 'duplicate block or terminal name')
+
+    def read_nets(self, net_file):
+        '''Parse net file. Blocks and terminals should have been read.
+        '''
+        text, strs = _read_tokens(net_file)
+        nnet, = _read_header(net_file, text, strs, 0, 'NumNets:', 1)
+        ntoken = len(strs)
+        ids = list(map(self.name_to_id.get, strs)) # None for unknown name
+        ids[0] = ids[1] = -1 # not a pin
+        pin_ptr = array('l', [0])
+        npin = 0
+        pos = 2
+        while pos < ntoken:
+            if strs[pos] != 'NetDegree:' or pos + 1 == ntoken:
+                raise ParseError(net_file, _lineno(text, pos), 'expected NetDegree:')
+            degree = _to_int(net_file, text, strs, pos + 1)
+            if degree < 0:
+                raise ParseError(net_file, _lineno(text, pos + 1), 'negative net degree')
+            ids[pos] = ids[pos+1] = -1 # not a pin
+            npin += degree
+            pin_ptr.append(npin)
+            pos += 2 + degree
+        if pos > ntoken:
+            raise ParseError(net_file, _lineno(text, ntoken), 'unexpected end of file')
+        if None in ids:
+            pin_pos = ids.index(None)
+            raise ParseError(net_file, _lineno(text, pin_pos), 'terminal/block {} not '
+                             'specified in block file'.format(strs[pin_pos]))
+        pin_idx = array('l', [pin for pin in ids if pin >= 0])
+        if len(pin_ptr) - 1 != nnet:
+            raise ParseError(net_file, _lineno(text, pos), 'expected {} nets, found {}'.format(
+                nnet, len(pin_ptr) - 1))
+        self.pin_ptr = pin_ptr
+        self.pin_idx = pin_idx
+
+def load(block_file, net_file, cache_dir=None):
+    '''Return design parsed from block file and net file.
+    If cache_dir is given, a cached design is loaded from it if inputs are unchanged, or
+    the parsed design is saved to it.
+    '''
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, _cache_key(block_file, net_file) + '.pickle')
+        try:
+            with open(cache_file, 'rb') as ifile:
+                return pickle.load(ifile)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass # parse again
+    design = Design()
+    design.read_blocks(block_file)
+    design.read_nets(net_file)
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as ofile:
+            pickle.dump(design, ofile, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file) # so that concurrent runs never read a partial file
+    return design
+
+def _cache_key(*files):
+    '''Return key of cached design parsed from given files.
+    '''
+    key = hashlib.sha1(str(CACHE_VERSION).encode())
+    for file_name in files:
+        stat = os.stat(file_name)
+        key.update('{}\0{}\0{}\0'.format(os.path.abspath(file_name), stat.st_size,
+                                         stat.st_mtime_ns).encode())
+    return key.hexdigest()
+
+def _read_tokens(file_name):
+    '''Read whole file, and return (text, tokens) of it.
+    '''
+    with open(file_name, 'rt') as ifile:
+        text = ifile.read()
+    return text, text.split()
+
+def _lineno(text, pos):
+    '''Return line number of the pos-th token in text, or of the last line if there are fewer.
+    Lines are counted only on error, so that parsing need not track them.
+    '''
+    lineno = 0
+    for lineno, line in enumerate(text.splitlines(), 1):
+        pos -= len(line.split())
+        if pos < 0:
+            break
+    return lineno
+
+def _read_header(file_name, text, strs, pos, keyword, nvalue):
+    '''Read header of keyword followed by nvalue integers from the pos-th token, and return the
+    integers.
+    '''
+    if pos + nvalue >= len(strs) or strs[pos] != keyword:
+        raise ParseError(file_name, _lineno(text, pos), 'expected {} with {} value(s)'.format(
+            keyword, nvalue))
+    return [_to_int(file_name, text, strs, idx) for idx in range(pos + 1, pos + nvalue + 1)]
+
+def _to_int(file_name, text, strs, pos):
+    '''Return integer of the pos-th token, raising ParseError if it is not.
+    '''
+    try:
+        return int(strs[pos])
+    except ValueError:
+        raise ParseError(file_name, _lineno(text, pos), 'expected integer, found {}'.format(
+            strs[pos]))
@@ -0,0 +1,51 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Memoization of evaluated floorplans, keyed by a hash of their representation and rotation.
+
+Annealing revisits floorplans: a rejected move is undone and moves around the same floorplan are
+tried again, and refinement passes over the same neighborhood more than once. Width, height and
+wire length of recently evaluated floorplans are kept in a bounded LRU cache, so that evaluating
+a floorplan again is a lookup instead of packing. A floorplan is keyed by the Zobrist hash of
+its sequence pair or B*-tree, updated along with it, XOR keys of rotated blocks. Hashes are
+64-bit, so collisions are rare enough to be ignored.
+'''
+
+from collections import OrderedDict
+from functools import reduce
+from itertools import compress
+from operator import xor
+
+import seqpair
+
+DEFAULT_SIZE = 4096 # floorplans kept
+
+class EvalCache:
+    '''Bounded LRU cache of (width, height, wire_len) of floorplans of nblock blocks, hashing
+    their representation by keys, those of sequence pairs by default.
+    '''
+    def __init__(self, nblock, size=DEFAULT_SIZE, keys=None):
+        self.keys = seqpair.ZobristKeys(nblock) if keys is None else keys
+        self.rotate_keys = seqpair.ZobristKeys(nblock, seed=1).idx_keys # of rotated blocks
+        self.size = size
+        self.entries = OrderedDict() # hash -> (width, height, wire_len), least recent first
+
+    def rotate_hash(self, rotate_lst):
+        '''Return hash of rotation of blocks.
+        '''
+        return reduce(xor, compress(self.rotate_keys, rotate_lst), 0)
+
+    def get(self, key):
+        '''Return (width, height, wire_len) of floorplan of given hash, or None if not cached.
+        '''
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        '''Keep (width, height, wire_len) of floorplan of given hash, evicting the least recently
+        used one if full.
+        '''
+        self.entries[key] = result
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
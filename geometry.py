@@ -0,0 +1,152 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Array-backed block geometry and nets, so that wire length of all nets is evaluated in one call.
+NumPy is used if available; otherwise columns fall back to array.array and plain loops.
+'''
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _column(typecode, values):
+    '''Create a contiguous column of given values.
+    '''
+    if np is not None:
+        return np.array(values, dtype=np.bool_ if typecode == 'b' else np.int64)
+    return array(typecode, values)
+
+class BlockArray:
+    '''Dimension, rotation and coordinates of blocks stored in columns.
+    Block i of the floorplan is described by the i-th entry of each column.
+    '''
+    def __init__(self, blocks):
+        nblock = len(blocks)
+        self.names = [block.name for block in blocks]
+        # dimension without rotation
+        self.raw_widths = _column('l', [block.get_height() if block.is_rotated else
+                                        block.get_width() for block in blocks])
+        self.raw_heights = _column('l', [block.get_width() if block.is_rotated else
+                                         block.get_height() for block in blocks])
+        self.rotated = _column('b', [block.is_rotated for block in blocks])
+        self.widths = _column('l', self.raw_widths) # width after rotation
+        self.heights = _column('l', self.raw_heights) # height after rotation
+        self.left_x = _column('l', [0] * nblock)
+        self.bottom_y = _column('l', [0] * nblock)
+
+    def __len__(self):
+        return len(self.names)
+
+    def set_rotation(self, rotate_lst):
+        '''Rotate blocks according to rotate_lst and update widths and heights.
+        '''
+        if np is not None:
+            self.rotated[:] = rotate_lst
+            self.widths = np.where(self.rotated, self.raw_heights, self.raw_widths)
+            self.heights = np.where(self.rotated, self.raw_widths, self.raw_heights)
+        else:
+            for idx, rotate in enumerate(rotate_lst):
+                self.rotated[idx] = rotate
+                width, height = self.raw_widths[idx], self.raw_heights[idx]
+                if rotate:
+                    width, height = height, width
+                self.widths[idx], self.heights[idx] = width, height
+
+    def set_coords(self, xs, ys):
+        '''Set left-x and bottom-y of blocks.
+        '''
+        self.left_x[:] = _column('l', xs)
+        self.bottom_y[:] = _column('l', ys)
+
+    def centers(self):
+        '''Return (center_x, center_y) columns of blocks, rounded down as Net.calc_length() does.
+        '''
+        if np is not None:
+            return ((2*self.left_x + self.widths) // 2, (2*self.bottom_y + self.heights) // 2)
+        return (array('l', [(2*x + w) // 2 for x, w in zip(self.left_x, self.widths)]),
+                array('l', [(2*y + h) // 2 for y, h in zip(self.bottom_y, self.heights)]))
+
+    def sync_blocks(self, blocks):
+        '''Write rotation and coordinates back to Block objects, which serve as views of blocks.
+        '''
+        for idx, block in enumerate(blocks):
+            block.is_rotated = bool(self.rotated[idx])
+            block.left_x = int(self.left_x[idx])
+            block.bottom_y = int(self.bottom_y[idx])
+            block.right_x = block.left_x + int(self.widths[idx])
+            block.top_y = block.bottom_y + int(self.heights[idx])
+
+class NetArray:
+    '''Nets stored as compressed sparse rows (CSR) of pins, with weights.
+    Pins of net i are pin_idx[pin_ptr[i]:pin_ptr[i+1]], where a pin indexes either a block
+    (index < number of blocks) or a fixed point (index - number of blocks), a corner of the box
+    of terminals of a net. offset is added to total HPWL.
+    '''
+    def __init__(self, nets, block_names, offset=0):
+        self.nblock = len(block_names)
+        self.offset = offset
+        name_to_idx = {name: idx for idx, name in enumerate(block_names)}
+        term_x = []
+        term_y = []
+        ptr = [0]
+        pins = []
+        weights = []
+        for net in nets:
+            pins.extend(name_to_idx[block.name] for block in net.blocks)
+            if net.box is not None:
+                pins.extend((self.nblock + len(term_x), self.nblock + len(term_x) + 1))
+                term_x.extend(net.box[0::2])
+                term_y.extend(net.box[1::2])
+            ptr.append(len(pins))
+            weights.append(net.weight)
+        self.pin_ptr = _column('l', ptr)
+        self.pin_idx = _column('l', pins)
+        self.weights = _column('l', weights)
+        self.term_x = _column('l', term_x)
+        self.term_y = _column('l', term_y)
+
+    def __len__(self):
+        return len(self.pin_ptr) - 1
+
+    def calc_wire_len(self, center_x, center_y):
+        '''Calculate total HPWL of all nets given block centers.
+        '''
+        if len(self) == 0:
+            return self.offset
+        if np is not None:
+            starts = self.pin_ptr[:-1]
+            total = self.offset
+            for centers, fixed in ((center_x, self.term_x), (center_y, self.term_y)):
+                coords = np.concatenate((centers, fixed))[self.pin_idx]
+                # segmented min/max over pins of each net
+                total += int(((np.maximum.reduceat(coords, starts) -
+                               np.minimum.reduceat(coords, starts)) * self.weights).sum())
+            return total
+        xx = center_x + self.term_x
+        yy = center_y + self.term_y
+        total = self.offset
+        pin_idx = self.pin_idx
+        for start, end, weight in zip(self.pin_ptr[:-1], self.pin_ptr[1:], self.weights):
+            pin_x = [xx[pin] for pin in pin_idx[start:end]]
+            pin_y = [yy[pin] for pin in pin_idx[start:end]]
+            total += weight * ((max(pin_x) - min(pin_x)) + (max(pin_y) - min(pin_y)))
+        return total
+
+    def calc_wire_lens(self, center_x, center_y):
+        '''Calculate total HPWL of all nets for each row of block centers, given as (K, n) arrays,
+        in one pass. NumPy is required.
+        Return (K,) array of HPWL.
+        '''
+        nrow = len(center_x)
+        total = np.full(nrow, self.offset, dtype=np.int64)
+        if len(self) == 0:
+            return total
+        starts = self.pin_ptr[:-1]
+        for centers, fixed in ((center_x, self.term_x), (center_y, self.term_y)):
+            coords = np.concatenate((centers, np.broadcast_to(fixed, (nrow, len(fixed)))),
+                                    axis=1)[:, self.pin_idx]
+            total += ((np.maximum.reduceat(coords, starts, axis=1) -
+                       np.minimum.reduceat(coords, starts, axis=1)) * self.weights).sum(axis=1)
+        return total
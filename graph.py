@@ -1,97 +1,191 @@
 '''2017PDA PA3 - Fixed Outline Floorplanning.
 
 Elements for graph manipulation.
+
+Graphs are array-backed: node i stands for block i, and out-nodes of node i are
+out_idx[out_ptr[i]:out_ptr[i+1]]. Source and target are implicit. Topological order is computed
+once per set of edges, so that when only weights of nodes change, e.g. blocks are rotated, the
+longest path is propagated again without rebuilding the graph.
+
+Constraint graphs built from a sequence pair are transitively reduced by default: an edge a -> b
+is kept only if no block lies between a and b in both sequences, as such an edge is implied by
+a -> c -> b. This leaves near-linear edges for typical floorplans instead of n(n-1)/2.
+
+Slack of a node is how much it can be pushed off its longest path, i.e. moved right or up,
+without lengthening the longest path of the graph, from a forward pass of longest paths from
+source and a backward one to target. Blocks of zero slack are critical: they lie on a longest
+path, and only changing them may shrink the floorplan.
 '''
 
-from collections import deque
+from array import array
+
+STATS = None # counters of graphs, propagations and traversed edges, if telemetry is on
+
+def set_stats(stats):
+    '''Count graphs, propagations and traversed edges into dict stats, or nowhere if None.
+    '''
+    global STATS # pylint: disable=W0603
+    STATS = stats
+
+def build_constraint_graphs(blocks, pos_seq, neg_idx, reduced=True):
+    '''Return (hcg, vcg), constraint graphs of blocks based on sequence pair, given by positive
+    sequence pos_seq and indexes neg_idx of blocks in negative sequence.
+    All implied edges are included unless reduced.
+    '''
+    hcg = Hcg(blocks) # horizontal constraint graph
+    vcg = Vcg(blocks) # vertical constraint graph
+    nblock = len(pos_seq)
+    for pos, blk in enumerate(pos_seq):
+        neg = neg_idx[blk]
+        # blocks after blk in positive sequence are to its right if after it in negative
+        # sequence, or below it if before; nearest ones in negative sequence are kept
+        right_bound = nblock
+        below_bound = -1
+        for other in pos_seq[pos+1:]:
+            other_neg = neg_idx[other]
+            if other_neg > neg:
+                if other_neg < right_bound:
+                    hcg.connect(blk, other)
+                    if reduced:
+                        right_bound = other_neg
+            else:
+                assert other_neg != neg, 'duplicate block index {} in sequence pair'.format(neg)
+                if other_neg > below_bound:
+                    vcg.connect(other, blk)
+                    if reduced:
+                        below_bound = other_neg
+            if right_bound == neg + 1 and below_bound == neg - 1:
+                break # no more edges from or to blk
+    hcg.connect_to_st()
+    vcg.connect_to_st()
+    return hcg, vcg
+
+def critical_nodes(slacks):
+    '''Return nodes of zero slack.
+    '''
+    return [idx for idx, slack in enumerate(slacks) if slack == 0]
 
 class Dag:
     '''Directed Acyclic Graph (DAG).
     '''
     def __init__(self, blocks):
-        self.nodes = []
-        self.name_to_nodes = {}
-        self.source = Node(None)
-        self.target = Node(None) # target not terminal
-        self._create_nodes(blocks)
+        self.blocks = blocks
+        self.nnode = len(blocks)
+        self.from_idx = array('i') # edges, in order of connection
+        self.to_idx = array('i')
+        self.out_ptr = None # adjacency in compressed sparse rows, built from edges
+        self.out_idx = None
+        self.order = None # topological order of nodes
+        self.starts = [0] * self.nnode # longest path from source to each node
+        if STATS is not None:
+            STATS['graphs'] += 1
 
     def connect(self, from_idx, to_idx):
-        '''Connect two nodes in both directions.
+        '''Connect two nodes.
         '''
-        from_node = self.nodes[from_idx]
-        to_node = self.nodes[to_idx]
-        from_node.add_out_node(to_node)
-        to_node.add_in_node(from_node)
+        self.from_idx.append(from_idx)
+        self.to_idx.append(to_idx)
+        self.order = None
 
     def connect_to_st(self):
-        '''Connect those without in_nodes to source, those without out_nodes to target.
-        '''
-        for node in self.nodes:
-            if not node.in_nodes:
-                self.source.add_out_node(node)
-                node.add_in_node(self.source)
-            if not node.out_nodes:
-                self.target.add_in_node(node)
-                node.add_out_node(self.target)
-
-    def init_count(self):
-        '''Initialize counts of nodes to their number of in-nodes.
-        '''
-        for node in self.nodes:
-            node.init_count()
-        self.target.init_count()
-        self.source.init_count()
+        '''Build adjacency and topological order of nodes.
+        Those without in-nodes are implicitly connected to source, those without out-nodes to
+        target.
+        '''
+        nnode = self.nnode
+        out_ptr = array('i', bytes(4 * (nnode + 1)))
+        in_count = [0] * nnode
+        for from_idx, to_idx in zip(self.from_idx, self.to_idx):
+            out_ptr[from_idx + 1] += 1
+            in_count[to_idx] += 1
+        for idx in range(nnode):
+            out_ptr[idx + 1] += out_ptr[idx]
+        out_idx = array('i', bytes(4 * len(self.to_idx)))
+        fill = out_ptr[:-1]
+        for from_idx, to_idx in zip(self.from_idx, self.to_idx):
+            out_idx[fill[from_idx]] = to_idx
+            fill[from_idx] += 1
+
+        # Kahn's algorithm, starting from out-nodes of source
+        order = [idx for idx in range(nnode) if in_count[idx] == 0]
+        for cur in order: # order grows while being iterated
+            for out in out_idx[out_ptr[cur]:out_ptr[cur+1]]:
+                in_count[out] -= 1
+                if in_count[out] == 0:
+                    order.append(out)
+        assert len(order) == nnode, 'Cycle in constraint graph'
+        self.out_ptr = out_ptr
+        self.out_idx = out_idx
+        self.order = array('i', order)
+
+    def longest_path(self, weights):
+        '''Propagate node weights from source to target along topological order.
+        Return weight of target, i.e. length of the longest path, and keep longest path from
+        source to each node in starts.
+        '''
+        if self.order is None:
+            self.connect_to_st()
+        out_ptr = self.out_ptr
+        out_idx = self.out_idx
+        starts = [0] * self.nnode
+        total = 0
+        for cur in self.order:
+            end = starts[cur] + weights[cur]
+            if end > total:
+                total = end
+            for out in out_idx[out_ptr[cur]:out_ptr[cur+1]]:
+                if end > starts[out]:
+                    starts[out] = end
+        self.starts = starts
+        if STATS is not None:
+            STATS['propagations'] += 1
+            STATS['edges'] += len(out_idx)
+        return total
+
+    def slacks(self, weights):
+        '''Return slack of each node given node weights.
+        '''
+        total = self.longest_path(weights)
+        out_ptr = self.out_ptr
+        out_idx = self.out_idx
+        tails = [0] * self.nnode # longest path from end of each node to target
+        for cur in reversed(self.order):
+            tail = 0
+            for out in out_idx[out_ptr[cur]:out_ptr[cur+1]]:
+                if weights[out] + tails[out] > tail:
+                    tail = weights[out] + tails[out]
+            tails[cur] = tail
+        return [total - start - weight - tail for start, weight, tail in
+                zip(self.starts, weights, tails)]
 
     def get_target_weight(self):
         '''Return calculated final weight (width or height of floorplan).
         '''
         raise NotImplementedError
 
-    def _propagate_weights(self):
-        '''Propagate node weights from source to target.
+    def get_slacks(self):
+        '''Return slack of each block, horizontal or vertical.
         '''
-        # TODO: no leaving most common login to derived class
         raise NotImplementedError
 
-    def _create_nodes(self, blocks):
-        '''Create new node to graph.
-        Each node is created for each block sent, and stands for it.
-        '''
-        for blk in blocks:
-            node = Node(blk)
-            self.nodes.append(node)
-            self.name_to_nodes[blk.name] = node
-
     def _set_coord(self):
         raise NotImplementedError
 
     def _print(self):
         '''Print interconnection of nodes.
         '''
-        for node in self.nodes:
-            print('> {}'.format(node.block.name))
-            for in_node in node.in_nodes:
-                try:
-                    print('{} ->'.format(in_node.block.name))
-                except AttributeError:
-                    print('Source ->')
-            for out_node in node.out_nodes:
-                try:
-                    print('-> {}'.format(out_node.block.name))
-                except AttributeError:
-                    print('-> Target')
-        print('> Source')
-        for out_node in self.source.out_nodes:
-            print('-> {}'.format(out_node.block.name))
-        print('> Target')
-        for in_node in self.target.in_nodes:
-            print('{} ->'.format(in_node.block.name))
+        if self.order is None:
+            self.connect_to_st()
+        for idx, block in enumerate(self.blocks):
+            print('> {}'.format(block.name))
+            for out in self.out_idx[self.out_ptr[idx]:self.out_ptr[idx+1]]:
+                print('-> {}'.format(self.blocks[out].name))
 
     def _print_weight(self):
-        '''Print weight of node, which is right-x of corresponding block in floorplan.
+        '''Print weight of node, which is left-x or bottom-y of corresponding block in floorplan.
         '''
-        for node in self.nodes:
-            print('{} x: {}'.format(node.block.name, node.weight))
+        for block, start in zip(self.blocks, self.starts):
+            print('{}: {}'.format(block.name, start))
 
 class Hcg(Dag):
     '''Horizontal constraint graph.
@@ -99,120 +193,46 @@ class Hcg(Dag):
     def __init__(self, blocks):
         Dag.__init__(self, blocks)
 
-    def _propagate_weights(self):
-        '''Create new node to graph.
-        Each node is created for each block sent, and stands for it.
-        '''
-        self.init_count()
-        visited = set()
-        queue = deque([self.source])
-        while queue:
-            cur = queue.popleft()
-            visited.add(cur)
-            for out in cur.out_nodes:
-                out.dec_count()
-                if cur.weight > out.weight:
-                    out.weight = cur.weight
-                if out.count == 0:
-                    # set weight
-                    try:
-                        out.weight += out.block.get_width()
-                    except AttributeError:
-                        # encounter target
-                        pass
-                    queue.append(out)
-
     def get_target_weight(self):
         '''Return calculated final weight (width of floorplan).
         '''
-        self._propagate_weights()
+        width = self.longest_path([block.get_width() for block in self.blocks])
         self._set_coord()
-        return self.target.weight
+        return width
+
+    def get_slacks(self):
+        '''Return horizontal slack of each block.
+        '''
+        return self.slacks([block.get_width() for block in self.blocks])
 
     def _set_coord(self):
         '''Set left-x and right-x of block.
         '''
-        for node in self.nodes:
-            node.block.left_x = node.weight - node.block.get_width()
-            node.block.right_x = node.weight
-            # print('{}: {} to {}'.format(node.block.name, node.block.left_x, node.block.right_x))
+        for block, start in zip(self.blocks, self.starts):
+            block.left_x = start
+            block.right_x = start + block.get_width()
 
 class Vcg(Dag):
-    '''Horizontal constraint graph.
+    '''Vertical constraint graph.
     '''
     def __init__(self, blocks):
         Dag.__init__(self, blocks)
 
-    def _propagate_weights(self):
-        '''Create new node to graph.
-        Each node is created for each block sent, and stands for it.
-        '''
-        self.init_count()
-        visited = set()
-        queue = deque([self.source])
-        while queue:
-            cur = queue.popleft()
-            visited.add(cur)
-            for out in cur.out_nodes:
-                out.dec_count()
-                if cur.weight > out.weight:
-                    out.weight = cur.weight
-                if out.count == 0:
-                    # set weight
-                    try:
-                        out.weight += out.block.get_height()
-                    except AttributeError:
-                        # enounter target
-                        pass
-                    queue.append(out)
-
     def get_target_weight(self):
         '''Return calculated final weight (height of floorplan).
         '''
-        self._propagate_weights()
+        height = self.longest_path([block.get_height() for block in self.blocks])
         self._set_coord()
-        return self.target.weight
-
-    def _set_coord(self):
-        '''Set bottom-y and top-y of block.
-        '''
-        for node in self.nodes:
-            node.block.bottom_y = node.weight - node.block.get_height()
-            node.block.top_y = node.weight
-            # print('{}: {} to {}'.format(node.block.name, node.block.bottom_y, node.block.top_y))
-
-class Node:
-    '''Node.
-    '''
-    def __init__(self, block):
-        self.block = block
-        self.in_nodes = [] # nodes, which serve as input nodes to this node
-        self.out_nodes = [] # output nodes
-        self.count = 0
-        self.level = 0
-        self.weight = 0
-
-    def add_in_node(self, in_node):
-        '''Add ancestor node.
-        '''
-        self.in_nodes.append(in_node)
-
-    def add_out_node(self, out_node):
-        '''Add descendant node.
-        '''
-        self.out_nodes.append(out_node)
+        return height
 
-    def inc_count(self):
-        '''Increase count.
+    def get_slacks(self):
+        '''Return vertical slack of each block.
         '''
-        self.count += 1
+        return self.slacks([block.get_height() for block in self.blocks])
 
-    def dec_count(self):
-        '''Decrease count.
-        '''
-        self.count -= 1
-
-    def init_count(self):
-        '''Initialize count to number of input nodes.
+    def _set_coord(self):
+        '''Set bottom-y and top-y of block.
         '''
-        self.count = len(self.in_nodes)
+        for block, start in zip(self.blocks, self.starts):
+            block.bottom_y = start
+            block.top_y = start + block.get_height()
@@ -0,0 +1,73 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Preprocessing of nets of a design, so that wire length is evaluated on fewer and smaller nets.
+
+Terminals are fixed, so the terminals of a net are collapsed into their bounding box once, which
+takes part in HPWL as its two corners would. Nets of the same blocks and box are merged into
+one net weighted by their count. A net of no block has a constant HPWL, and one of a single
+block and no terminal has none; such nets are dropped, and the HPWL of the former is kept as a
+constant offset of total wire length, which is thus the same as that of the original nets.
+'''
+
+from array import array
+
+class Netlist:
+    '''Reduced nets of a design. Blocks of net i are pin_idx[pin_ptr[i]:pin_ptr[i+1]], by ID,
+    weights[i] is the number of nets merged into it, and boxes[i] is (min_x, min_y, max_x,
+    max_y) of its terminals, or None if it has none.
+    '''
+    def __init__(self):
+        self.pin_ptr = array('l', [0])
+        self.pin_idx = array('l')
+        self.weights = array('l')
+        self.boxes = []
+        self.offset = 0 # HPWL of dropped nets
+        # size of original nets, and nets merged into others or dropped
+        self.nnet_orig = 0
+        self.npin_orig = 0
+        self.nmerged = 0
+        self.ndropped = 0
+
+    def nnet(self):
+        '''Return number of nets.
+        '''
+        return len(self.pin_ptr) - 1
+
+    def npin(self):
+        '''Return number of pins of blocks, and distinct corners of boxes.
+        '''
+        return len(self.pin_idx) + sum(1 if box[:2] == box[2:] else 2 for box in self.boxes
+                                       if box is not None)
+
+def preprocess(dsgn):
+    '''Return Netlist reduced from nets of design.
+    '''
+    netlist = Netlist()
+    nblock = dsgn.nblock
+    term_x, term_y = dsgn.term_x, dsgn.term_y
+    net_of = {} # (blocks, box) -> index of reduced net
+    for start, end in zip(dsgn.pin_ptr[:-1], dsgn.pin_ptr[1:]):
+        netlist.nnet_orig += 1
+        netlist.npin_orig += end - start
+        pins = dsgn.pin_idx[start:end]
+        blks = tuple(sorted({pin for pin in pins if pin < nblock}))
+        xx = [term_x[pin - nblock] for pin in pins if pin >= nblock]
+        yy = [term_y[pin - nblock] for pin in pins if pin >= nblock]
+        box = (min(xx), min(yy), max(xx), max(yy)) if xx else None
+        if not blks or (len(blks) == 1 and box is None):
+            if box is not None:
+                netlist.offset += (box[2] - box[0]) + (box[3] - box[1])
+            netlist.ndropped += 1
+            continue
+        key = (blks, box)
+        idx = net_of.get(key)
+        if idx is not None:
+            netlist.weights[idx] += 1
+            netlist.nmerged += 1
+            continue
+        net_of[key] = netlist.nnet()
+        netlist.pin_idx.extend(blks)
+        netlist.pin_ptr.append(len(netlist.pin_idx))
+        netlist.weights.append(1)
+        netlist.boxes.append(box)
+    return netlist
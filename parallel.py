@@ -0,0 +1,224 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Parallel simulated-annealing with replica exchange (parallel tempering).
+
+Initial representations are sampled by all worker processes in batches, and the best ones seed
+the replicas, so that they start from several good and diverse points.
+Each replica is an annealing chain of its own floorplan state and random generator, running at
+temperature of the common cooling schedule scaled by a ladder factor. After each temperature
+step, replicas at adjacent temperatures exchange states by the Metropolis criterion, and the
+global best floorplan is collected.
+'''
+
+import math
+import random
+import time
+from multiprocessing import Pool
+
+import graph
+import telemetry
+
+TEMP_LADDER = 0.5 # ratio of temperatures of adjacent replicas
+BATCHES_PER_WORKER = 4 # batches of initial sampling per worker, for load balance
+
+_FLOORPLAN = None # floorplan of worker process
+
+class Replica:
+    '''State of an annealing chain.
+    '''
+    def __init__(self, flpr, rng_state):
+        self.rep = flpr.rep.copy()
+        self.rotate_lst = flpr.rotate_lst[:]
+        self.is_valid = flpr.is_valid
+        self.cost = flpr.cost
+        self.best_sol = flpr.best_sol.copy()
+        self.best_rotate = flpr.best_rotate[:]
+        self.best_cost = flpr.best_cost
+        self.best_is_valid = flpr.best_is_valid
+        self.move_probs = flpr.move_probs
+        self.rng_state = rng_state
+        # statistics of last temperature step
+        self.move_cnt = 0
+        self.uphill = 0
+        self.reject_cnt = 0
+        self.telemetry = None
+
+    def load(self, flpr):
+        '''Set floorplan to state of this replica.
+        '''
+        flpr.rep = self.rep
+        flpr.rotate_lst = self.rotate_lst
+        flpr.is_valid = self.is_valid
+        flpr.cost = self.cost
+        flpr.best_sol = self.best_sol
+        flpr.best_rotate = self.best_rotate
+        flpr.best_cost = self.best_cost
+        flpr.best_is_valid = self.best_is_valid
+        flpr.set_move_probs(self.move_probs)
+
+    def save(self, flpr):
+        '''Keep state of floorplan to this replica.
+        '''
+        self.rep = flpr.rep
+        self.rotate_lst = flpr.rotate_lst
+        self.is_valid = flpr.is_valid
+        self.cost = flpr.cost
+        self.best_sol = flpr.best_sol
+        self.best_rotate = flpr.best_rotate
+        self.best_cost = flpr.best_cost
+        self.best_is_valid = flpr.best_is_valid
+        self.move_probs = flpr.move_probs
+
+    def exchange(self, other):
+        '''Exchange current floorplan, but not the best one, with other replica.
+        '''
+        (self.rep, self.rotate_lst, self.is_valid, self.cost,
+         other.rep, other.rotate_lst, other.is_valid, other.cost) = (
+             other.rep, other.rotate_lst, other.is_valid, other.cost,
+             self.rep, self.rotate_lst, self.is_valid, self.cost)
+
+def place_block(flpr, nworker, seed, nshuffle, resume=None):
+    '''Do floorplanning of flpr in a pool of nworker processes.
+    Initial solution is searched with nshuffle random representations, and then replicas are
+    annealed, each phase until its time given by flpr.scheduler is up.
+    If checkpoint state resume is given, all replicas start from it instead.
+    '''
+    with Pool(nworker, initializer=_init_worker, initargs=(flpr,)) as pool:
+        if resume is None:
+            flpr.scheduler.start_phase('init')
+            reps = initialize(flpr, pool, nworker, seed, nshuffle, nworker)
+            flpr.scheduler.start_phase('anneal', flpr.refine_reserve(), flpr.anneal_share)
+            anneal(flpr, pool, nworker, seed, reps)
+        else:
+            flpr.scheduler.start_phase('anneal', flpr.refine_reserve())
+            anneal(flpr, pool, nworker, seed, None, flpr.resume_anneal(resume))
+
+def initialize(flpr, pool, nworker, seed, nsample, ntop):
+    '''Evaluate nsample random representations in batches over the pool.
+    Return list of up to ntop best representations, best first.
+    '''
+    rng = random.Random(seed)
+    nbatch = nworker * BATCHES_PER_WORKER
+    batches = [(nsample // nbatch + (1 if idx < nsample % nbatch else 0), rng.getrandbits(64),
+                ntop, flpr.scheduler) for idx in range(nbatch)]
+    samples = []
+    for batch_samples in pool.map(_sample_reps, batches):
+        samples.extend(batch_samples)
+    flpr.scheduler.count(nsample)
+    samples.sort(key=lambda sample: sample[0])
+    print('Shuffle: best area cost {:,} in {} samples'.format(samples[0][0], nsample))
+    return [rep for _, rep in samples[:ntop]]
+
+def anneal(flpr, pool, nworker, seed, reps, temp=None):
+    '''Run nworker annealing replicas of floorplan flpr in the pool, starting from given
+    representations in turn, and set flpr to the global best floorplan.
+    If reps is None, replicas start from current state of flpr at temperature temp instead.
+    Replica i is seeded by seed + i, if seed is not None.
+    '''
+    rng = random.Random(seed) # for exchange of replicas
+    if reps is not None:
+        flpr.rep = reps[0].copy()
+        temp = flpr.init_schedule() # T
+    norms = (flpr.area_norm, flpr.wire_norm)
+    replicas = []
+    for idx in range(nworker):
+        if reps is not None:
+            flpr.rep = reps[idx % len(reps)].copy()
+            flpr.start_anneal()
+        replica_rng = random.Random(None if seed is None else seed + idx)
+        replicas.append(Replica(flpr, replica_rng.getstate()))
+    print('Init cost: {:,}'.format(min(replica.cost for replica in replicas)))
+
+    uphill_lim, move_lim = flpr.schedule.step_limits(len(flpr.blocks)) # N
+    while True:
+        step_start = time.perf_counter()
+        temps = [temp * TEMP_LADDER**idx for idx in range(nworker)]
+        replicas = pool.map(_anneal_replica, [
+            (replica, replica_temp, uphill_lim, move_lim, flpr.scheduler, norms)
+            for replica, replica_temp in zip(replicas, temps)])
+        move_cnt = sum(replica.move_cnt for replica in replicas)
+        flpr.scheduler.count(move_cnt)
+        if flpr.telemetry is not None:
+            for replica in replicas:
+                flpr.telemetry.merge(replica.telemetry)
+            flpr.telemetry.record_step(
+                temp, move_cnt, sum(replica.uphill for replica in replicas),
+                sum(replica.reject_cnt for replica in replicas),
+                time.perf_counter() - step_start)
+        _exchange_replicas(replicas, temps, rng)
+        reject_ratios = [replica.reject_cnt / replica.move_cnt for replica in replicas]
+        progress = flpr.anneal_progress()
+        accept_ratio = sum(1.0 - ratio for ratio in reject_ratios) / nworker
+        temp = flpr.schedule.next_temp(temp, accept_ratio, progress)
+        if flpr.schedule.is_frozen(min(reject_ratios), progress) or flpr.scheduler.time_up():
+            if flpr.scheduler.time_up():
+                print('SA ends at time-up', flush=True)
+            else:
+                print('SA ends due to heavy rejection', flush=True)
+            break
+        if flpr.checkpointer is not None:
+            best = _best_replica(replicas)
+            best.load(flpr)
+            flpr.checkpointer.maybe_save(flpr, temp, best.rng_state)
+
+    best = _best_replica(replicas)
+    best.load(flpr)
+    if flpr.checkpointer is not None:
+        flpr.checkpointer.save(flpr, temp, best.rng_state)
+    flpr.final_temp = temp
+    flpr.finish_anneal()
+
+def _best_replica(replicas):
+    '''Return replica of the best floorplan.
+    Valid floorplans are preferred, and costs of which are comparable to each other.
+    '''
+    return min(replicas, key=lambda replica: (not replica.best_is_valid, replica.best_cost))
+
+def _exchange_replicas(replicas, temps, rng):
+    '''Exchange states of replicas at adjacent temperatures by the Metropolis criterion.
+    Only replicas in the same phase (valid or not) have comparable costs to exchange.
+    '''
+    for idx in range(len(replicas) - 1):
+        hot, cold = replicas[idx], replicas[idx+1]
+        if hot.is_valid != cold.is_valid:
+            continue
+        exponent = (1/temps[idx+1] - 1/temps[idx]) * (cold.cost - hot.cost)
+        if exponent >= 0 or rng.random() < math.exp(exponent):
+            hot.exchange(cold)
+
+def _init_worker(flpr):
+    '''Keep floorplan, sent once per worker process.
+    '''
+    global _FLOORPLAN # pylint: disable=W0603
+    _FLOORPLAN = flpr
+
+def _sample_reps(args):
+    '''Sample a batch of random representations in worker process.
+    Return list of (area_cost, rep) of the best ones.
+    '''
+    nsample, batch_seed, ntop, sched = args
+    random.seed(batch_seed)
+    _FLOORPLAN.scheduler = sched
+    return _FLOORPLAN.sample_reps(nsample, ntop)
+
+def _anneal_replica(args):
+    '''Run one temperature step of a replica in worker process.
+    Return the updated replica.
+    '''
+    replica, temp, uphill_lim, move_lim, sched, norms = args
+    flpr = _FLOORPLAN
+    flpr.scheduler = sched
+    flpr.area_norm, flpr.wire_norm = norms
+    replica.load(flpr)
+    random.setstate(replica.rng_state)
+    if flpr.telemetry is not None:
+        flpr.telemetry = telemetry.Telemetry(flpr.telemetry.move_names)
+    graph.set_stats(flpr.telemetry.graph if flpr.telemetry is not None else None)
+    move_cnt, uphill, reject_cnt = flpr.anneal_at(temp, uphill_lim, move_lim)
+    replica.save(flpr)
+    replica.rng_state = random.getstate()
+    replica.move_cnt = move_cnt
+    replica.uphill = uphill
+    replica.reject_cnt = reject_cnt
+    replica.telemetry = flpr.telemetry
+    return replica
@@ -0,0 +1,90 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Interface of floorplan representations, which annealing perturbs and packs.
+
+A representation, e.g. a sequence pair or a B*-tree, places blocks relative to each other, and
+packs them given their dimension. Annealing sees it only through this interface: a move swaps two
+blocks, or inserts a block next to another one, and returns an undo record, with which the
+representation undoes or redoes the move; and a representation may keep a hash of itself by keys
+of its own, updated along with moves, so that evaluated floorplans can be cached.
+
+An undo record is a tuple whose first item tells whether the move changed all of the
+representation, e.g. both sequences of a sequence pair; the rest is up to the representation.
+'''
+
+SWAP = 0 # kinds of moves in undo records
+INSERT = 1
+
+class Representation:
+    '''Representation of a floorplan of nblock blocks. self.keys are keys hashing it, or None
+    not to hash, and self.hash is its hash by them.
+    '''
+    @classmethod
+    def initial(cls, nblock):
+        '''Return initial representation of nblock blocks.
+        '''
+        raise NotImplementedError
+
+    @staticmethod
+    def new_keys(nblock):
+        '''Return keys hashing representations of nblock blocks.
+        '''
+        raise NotImplementedError
+
+    def set_keys(self, keys):
+        '''Hash this representation by given keys from now on.
+        '''
+        raise NotImplementedError
+
+    def swap(self, blk0, blk1, both=True):
+        '''Swap two blocks, in all of the representation, or in part of it only if not both and
+        it has parts.
+        Return undo record of the move.
+        '''
+        raise NotImplementedError
+
+    def insert(self, blk, target, side, both=True):
+        '''Remove block blk and insert it next to block target, on side 0 or 1, in all of the
+        representation, or in part of it only if not both and it has parts.
+        Return undo record of the move.
+        '''
+        raise NotImplementedError
+
+    def undo(self, record):
+        '''Restore representation perturbed by the move of given undo record.
+        '''
+        raise NotImplementedError
+
+    def redo(self, record):
+        '''Make the move of given undo record again after undo() restored it.
+        '''
+        raise NotImplementedError
+
+    def neighborhood(self, window):
+        '''Generate undo records of swaps of blocks at most window apart in an order of blocks,
+        without making them; redo() makes one, and undo() restores it. Records are generated
+        lazily, so they apply to the representation as perturbed when each is generated.
+        '''
+        raise NotImplementedError
+
+    def shuffle(self):
+        '''Place blocks randomly.
+        '''
+        raise NotImplementedError
+
+    def copy(self):
+        '''Return a copy of this representation.
+        '''
+        raise NotImplementedError
+
+    def assign(self, other):
+        '''Make this representation the same as other one in place.
+        '''
+        raise NotImplementedError
+
+    def pack(self, widths, heights):
+        '''Pack blocks placed by this representation.
+        widths[i] and heights[i] are the dimension of block i.
+        Return (xs, ys, width, height), where xs[i] and ys[i] are left-x and bottom-y of block i.
+        '''
+        raise NotImplementedError
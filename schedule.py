@@ -0,0 +1,103 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Annealing schedules, which decide temperature of simulated-annealing.
+
+A schedule gives initial temperature, possibly estimated from cost deltas of uphill moves
+sampled around initial floorplan, updates temperature after each temperature step, and tells
+whether annealing is frozen. Adaptive schedules work on normalized cost, so that temperature
+is independent of the scale of area and wire length of a design.
+'''
+
+import math
+
+class ClassicSchedule:
+    '''Fixed geometric cooling on raw cost, as the original floorplanner does.
+    '''
+    adaptive = False # no sampling of moves and no normalization of cost
+    nsample = 0
+
+    def __init__(self, init_temp=200.0, cool_ratio=0.98, frozen_reject=0.99):
+        self.init_temp = init_temp
+        self.cool_ratio = cool_ratio
+        self.frozen_reject = frozen_reject
+
+    def start(self, uphill_deltas): # pylint: disable=W0613
+        '''Return initial temperature.
+        '''
+        return self.init_temp
+
+    @staticmethod
+    def step_limits(nblock):
+        '''Return (uphill_lim, move_lim), limits on uphill moves and moves of a temperature step.
+        '''
+        return 50 * nblock, 100 * nblock
+
+    def next_temp(self, temp, accept_ratio, progress): # pylint: disable=W0613
+        '''Return temperature of next step, given acceptance ratio of moves at temperature temp,
+        and progress of annealing from 0.0 to 1.0 in time.
+        '''
+        return self.cool_ratio * temp
+
+    def is_frozen(self, reject_ratio, progress): # pylint: disable=W0613
+        '''Return True if annealing should end.
+        '''
+        return reject_ratio > self.frozen_reject
+
+class LamSchedule:
+    '''Lam-style adaptive schedule.
+    Temperature is raised or lowered after each step so that acceptance ratio follows the target
+    curve of Lam and Delosme: from near 1.0 down to 0.44 in the first 15% of time, staying at
+    0.44 until 65%, then dropping towards zero.
+    '''
+    adaptive = True
+
+    def __init__(self, init_accept=0.95, adjust_ratio=0.9, step_moves=2, nsample=500,
+                 frozen_reject=0.999):
+        self.init_accept = init_accept # expected acceptance of uphill moves at the start
+        self.adjust_ratio = adjust_ratio
+        self.step_moves = step_moves # moves per block in a temperature step
+        self.nsample = nsample # moves sampled to estimate initial temperature
+        self.frozen_reject = frozen_reject
+
+    def start(self, uphill_deltas):
+        '''Return initial temperature, with which an average uphill move is accepted with
+        probability init_accept.
+        '''
+        if not uphill_deltas:
+            return 1.0
+        return -(sum(uphill_deltas) / len(uphill_deltas)) / math.log(self.init_accept)
+
+    def step_limits(self, nblock):
+        '''Return (uphill_lim, move_lim), limits on uphill moves and moves of a temperature step.
+        Steps are short, so that temperature follows the target closely.
+        '''
+        move_lim = self.step_moves * nblock
+        return move_lim, move_lim
+
+    def next_temp(self, temp, accept_ratio, progress):
+        '''Return temperature of next step, given acceptance ratio of moves at temperature temp,
+        and progress of annealing from 0.0 to 1.0 in time.
+        '''
+        if accept_ratio > self.target_accept(progress):
+            return temp * self.adjust_ratio
+        return temp / self.adjust_ratio
+
+    def is_frozen(self, reject_ratio, progress):
+        '''Return True if annealing should end.
+        '''
+        return progress >= 1.0 or (progress > 0.65 and reject_ratio > self.frozen_reject)
+
+    @staticmethod
+    def target_accept(progress):
+        '''Return target acceptance ratio at given progress.
+        '''
+        if progress < 0.15:
+            return 0.44 + 0.56 * 560 ** (-progress / 0.15)
+        elif progress < 0.65:
+            return 0.44
+        return 0.44 * 440 ** (-(progress - 0.65) / 0.35)
+
+SCHEDULES = {
+    'classic': ClassicSchedule,
+    'lam': LamSchedule,
+}
@@ -0,0 +1,123 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Scheduler of run time, which owns the time budget of a run and splits it into phases.
+
+A run consists of phases, initialization, annealing and refinement, in order. Each phase ends at
+its own deadline, derived from remaining budget and the rate of moves measured so far. Deadline
+is checked once per move, but the clock is read only every so many calls, adapting to the
+measured rate so that it is read about every CHECK_PERIOD seconds.
+'''
+
+import time
+
+DEFAULT_BUDGET = 295.0 # seconds
+INIT_SHARE = 50.0 / 295.0 # share of remaining budget for initialization
+MAX_RESERVE_SHARE = 0.2 # max share of remaining budget reserved for later phases
+CHECK_PERIOD = 0.01 # seconds between reading of clock
+
+class Scheduler:
+    '''Run-time scheduler.
+    The clock starts when the scheduler is created.
+    '''
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.start_time = time.time()
+        self.budget = budget
+        self.deadline = self.start_time + budget
+        self.phase = None
+        self.phase_start = self.start_time
+        self.phase_deadline = self.deadline
+        self.moves = {} # phase -> number of moves
+        self.durations = {} # phase -> seconds spent
+        self._calls = 0 # calls of time_up() since last reading of clock
+        self._check_every = 1 # calls between reading of clock
+        self._last_check = self.start_time
+        self._expired = False
+
+    def start_phase(self, phase, reserve_moves=0, share=None):
+        '''End current phase and start a new one.
+        Time for reserve_moves moves, at the rate measured so far, is reserved for later phases,
+        unless the phase is given a share of remaining budget.
+        '''
+        now = time.time()
+        self._end_phase(now)
+        self.phase = phase
+        self.phase_start = now
+        remain = max(self.deadline - now, 0.0)
+        if phase == 'init' and share is None:
+            share = INIT_SHARE
+        if share is not None:
+            self.phase_deadline = now + share * remain
+        else:
+            rate = self.moves_per_sec()
+            reserve = reserve_moves / rate if rate > 0 else 0.0
+            self.phase_deadline = self.deadline - min(reserve, MAX_RESERVE_SHARE * remain)
+        self.moves.setdefault(phase, 0)
+        self._calls = 0
+        self._check_every = 1
+        self._last_check = now
+        self._expired = now >= self.phase_deadline
+
+    def finish(self):
+        '''End current phase.
+        '''
+        self._end_phase(time.time())
+        self.phase = None
+
+    def time_up(self):
+        '''Count a move, and return True if deadline of current phase is reached.
+        '''
+        self._calls += 1
+        if self._expired or self._calls < self._check_every:
+            return self._expired
+        now = time.time()
+        if now > self._last_check:
+            # read clock about every CHECK_PERIOD seconds at current rate of calls
+            self._check_every = max(1, int(self._calls * CHECK_PERIOD / (now - self._last_check)))
+        self._count(self._calls)
+        self._calls = 0
+        self._last_check = now
+        self._expired = now >= self.phase_deadline
+        return self._expired
+
+    def count(self, nmove):
+        '''Count moves done elsewhere, e.g. in worker processes, in current phase.
+        '''
+        self._count(nmove)
+
+    def progress(self):
+        '''Return fraction of time of current phase elapsed.
+        '''
+        duration = self.phase_deadline - self.phase_start
+        if duration <= 0:
+            return 1.0
+        return min((time.time() - self.phase_start) / duration, 1.0)
+
+    def elapsed(self):
+        '''Return seconds since start of run.
+        '''
+        return time.time() - self.start_time
+
+    def moves_per_sec(self):
+        '''Return rate of moves measured over all phases so far.
+        '''
+        duration = sum(self.durations.values())
+        nmove = sum(self.moves.values())
+        if self.phase is not None:
+            duration += time.time() - self.phase_start
+            nmove += self._calls
+        return nmove / duration if duration > 0 else 0.0
+
+    def _count(self, nmove):
+        '''Add moves to current phase.
+        '''
+        if self.phase is not None:
+            self.moves[self.phase] += nmove
+
+    def _end_phase(self, now):
+        '''Record moves and duration of current phase.
+        '''
+        if self.phase is None:
+            return
+        self._count(self._calls)
+        self._calls = 0
+        self.durations[self.phase] = self.durations.get(self.phase, 0.0) + now - self.phase_start
@@ -0,0 +1,330 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Sequence-pair packing via weighted longest common subsequence.
+
+For a sequence pair (P, N), block a is to the left of block b if a precedes b in both P and N,
+and block a is below block b if a follows b in P but precedes b in N.
+The left-x of a block is then the weighted longest common subsequence of P and N ending right
+before the block, which is computed by a Fenwick tree of prefix maxima over positions in N,
+giving O(n log n) packing instead of building HCG/VCG with O(n^2) edges.
+
+A sequence pair may keep a Zobrist-style hash of itself: each block draws a random 64-bit key for
+each sequence and each index draws another, and the hash is the sum of products of keys of every
+block and its index. A swap or a move of blocks changes only the terms of indexes in between, so
+the hash is updated along with the sequences, and only O(n) keys are needed instead of a key for
+every pair of block and index.
+'''
+
+import random
+from operator import mul
+from random import shuffle
+
+from representation import INSERT, SWAP, Representation
+
+HASH_MASK = (1 << 64) - 1
+
+class ZobristKeys:
+    '''Random keys of blocks and indexes, hashing sequence pairs of nblock blocks.
+    Keys are drawn from a generator of their own, so that the random module is left untouched.
+    '''
+    def __init__(self, nblock, seed=0):
+        rng = random.Random(seed)
+        self.pos_keys = [rng.getrandbits(64) for _ in range(nblock)] # of blocks in positive
+        self.neg_keys = [rng.getrandbits(64) for _ in range(nblock)] # ... and negative sequence
+        self.idx_keys = [rng.getrandbits(64) for _ in range(nblock)] # of indexes
+
+    def hash(self, seq_pair):
+        '''Return hash of sequence pair.
+        '''
+        nblock = len(self.idx_keys)
+        return (_range_hash(seq_pair.pos_seq, self.pos_keys, self.idx_keys, 0, nblock) +
+                _range_hash(seq_pair.neg_seq, self.neg_keys, self.idx_keys, 0, nblock)) & HASH_MASK
+
+class SequencePair(Representation):
+    '''Sequence pair, two sequences of block indexes, along with the position of each block in
+    both sequences, so relation between two blocks is found in constant time. Moves not made in
+    both sequences are made in positive sequence only.
+    '''
+    def __init__(self, pos_seq, neg_seq):
+        self.pos_seq = list(pos_seq) # positive sequence
+        self.neg_seq = list(neg_seq) # negative sequence
+        self.pos_idx = _inverse(self.pos_seq) # block -> index in positive sequence
+        self.neg_idx = _inverse(self.neg_seq) # block -> index in negative sequence
+        self.keys = None # ZobristKeys, or None not to hash
+        self.hash = 0
+
+    def __getstate__(self):
+        '''Pickle without keys, which the receiver sets again.
+        '''
+        state = self.__dict__.copy()
+        state['keys'] = None
+        state['hash'] = 0
+        return state
+
+    @classmethod
+    def initial(cls, nblock):
+        '''Return sequence pair of nblock blocks in order in both sequences.
+        '''
+        return cls(range(nblock), range(nblock))
+
+    @staticmethod
+    def new_keys(nblock):
+        '''Return ZobristKeys hashing sequence pairs of nblock blocks.
+        '''
+        return ZobristKeys(nblock)
+
+    def set_keys(self, keys):
+        '''Hash this sequence pair by given ZobristKeys from now on.
+        '''
+        self.keys = keys
+        self.hash = keys.hash(self)
+
+    def is_left_of(self, blk0, blk1):
+        '''Return True if block blk0 is to the left of block blk1.
+        '''
+        return self.pos_idx[blk0] < self.pos_idx[blk1] and self.neg_idx[blk0] < self.neg_idx[blk1]
+
+    def is_below(self, blk0, blk1):
+        '''Return True if block blk0 is below block blk1.
+        '''
+        return self.pos_idx[blk0] > self.pos_idx[blk1] and self.neg_idx[blk0] < self.neg_idx[blk1]
+
+    def swap_pos(self, idx0, idx1):
+        '''Swap two blocks at given indexes in positive sequence.
+        '''
+        if self.keys is not None:
+            self._hash_swap(self.pos_seq, self.keys.pos_keys, idx0, idx1)
+        _swap(self.pos_seq, self.pos_idx, idx0, idx1)
+
+    def swap_neg(self, idx0, idx1):
+        '''Swap two blocks at given indexes in negative sequence.
+        '''
+        if self.keys is not None:
+            self._hash_swap(self.neg_seq, self.keys.neg_keys, idx0, idx1)
+        _swap(self.neg_seq, self.neg_idx, idx0, idx1)
+
+    def move_pos(self, idx0, idx1):
+        '''Remove block at index idx0 from positive sequence and insert it at index idx1.
+        move_pos(idx1, idx0) undoes it.
+        '''
+        if self.keys is None:
+            _move(self.pos_seq, self.pos_idx, idx0, idx1)
+        else:
+            self._hash_move(self.pos_seq, self.pos_idx, self.keys.pos_keys, idx0, idx1)
+
+    def move_neg(self, idx0, idx1):
+        '''Remove block at index idx0 from negative sequence and insert it at index idx1.
+        move_neg(idx1, idx0) undoes it.
+        '''
+        if self.keys is None:
+            _move(self.neg_seq, self.neg_idx, idx0, idx1)
+        else:
+            self._hash_move(self.neg_seq, self.neg_idx, self.keys.neg_keys, idx0, idx1)
+
+    def swap_blocks(self, blk0, blk1):
+        '''Swap two blocks in both positive and negative sequences.
+        '''
+        self.swap_pos(self.pos_idx[blk0], self.pos_idx[blk1])
+        self.swap_neg(self.neg_idx[blk0], self.neg_idx[blk1])
+
+    def swap(self, blk0, blk1, both=True):
+        '''Swap two blocks in both sequences, or in positive sequence only if not both.
+        Return undo record of the move.
+        '''
+        if both:
+            self.swap_blocks(blk0, blk1)
+        else:
+            self.swap_pos(self.pos_idx[blk0], self.pos_idx[blk1])
+        return (both, SWAP, blk0, blk1)
+
+    def insert(self, blk, target, side, both=True):
+        '''Move block blk right before (side 0) or after (side 1) block target in both
+        sequences, or in positive sequence only if not both.
+        Return undo record of the move.
+        '''
+        pos_idx = self.pos_idx[blk]
+        # index of target after blk is removed, and then before or after target
+        new_pos_idx = self.pos_idx[target] - (self.pos_idx[target] > pos_idx) + side
+        self.move_pos(pos_idx, new_pos_idx)
+        if not both:
+            return (both, INSERT, pos_idx, new_pos_idx)
+        neg_idx = self.neg_idx[blk]
+        new_neg_idx = self.neg_idx[target] - (self.neg_idx[target] > neg_idx) + side
+        self.move_neg(neg_idx, new_neg_idx)
+        return (both, INSERT, pos_idx, new_pos_idx, neg_idx, new_neg_idx)
+
+    def undo(self, record):
+        '''Restore sequence pair perturbed by the move of given undo record.
+        '''
+        both, kind = record[:2]
+        if kind == SWAP:
+            self.swap(record[2], record[3], both) # involution
+            return
+        if both:
+            self.move_neg(record[5], record[4])
+        self.move_pos(record[3], record[2])
+
+    def redo(self, record):
+        '''Make the move of given undo record again after undo() restored it.
+        '''
+        both, kind = record[:2]
+        if kind == SWAP:
+            self.swap(record[2], record[3], both)
+            return
+        self.move_pos(record[2], record[3])
+        if both:
+            self.move_neg(record[4], record[5])
+
+    def neighborhood(self, window):
+        '''Generate undo records of swaps of blocks at most window apart in positive sequence,
+        in positive sequence only and in both sequences, without making them.
+        '''
+        nblock = len(self.pos_seq)
+        for idx in range(nblock):
+            for other in range(idx + 1, min(idx + 1 + window, nblock)):
+                # blocks at indexes are read when generated, after previous moves
+                yield (False, SWAP, self.pos_seq[idx], self.pos_seq[other])
+                yield (True, SWAP, self.pos_seq[idx], self.pos_seq[other])
+
+    def _hash_swap(self, seq, blk_keys, idx0, idx1):
+        '''Update hash for swap of blocks at given indexes in a sequence, before the swap.
+        '''
+        idx_keys = self.keys.idx_keys
+        self.hash = (self.hash + (blk_keys[seq[idx1]] - blk_keys[seq[idx0]]) *
+                     (idx_keys[idx0] - idx_keys[idx1])) & HASH_MASK
+
+    def _hash_move(self, seq, seq_idx, blk_keys, idx0, idx1):
+        '''Move block in a sequence as _move() does, and update hash for the blocks in between.
+        '''
+        idx_keys = self.keys.idx_keys
+        low, high = min(idx0, idx1), max(idx0, idx1) + 1
+        old = _range_hash(seq, blk_keys, idx_keys, low, high)
+        _move(seq, seq_idx, idx0, idx1)
+        self.hash = (self.hash - old + _range_hash(seq, blk_keys, idx_keys, low, high)) & HASH_MASK
+
+    def shuffle(self):
+        '''Shuffle both sequences randomly.
+        '''
+        shuffle(self.pos_seq)
+        shuffle(self.neg_seq)
+        self.pos_idx = _inverse(self.pos_seq)
+        self.neg_idx = _inverse(self.neg_seq)
+        if self.keys is not None:
+            self.hash = self.keys.hash(self)
+
+    def copy(self):
+        '''Return a copy of this sequence pair.
+        '''
+        seq_pair = SequencePair.__new__(SequencePair)
+        seq_pair.pos_seq = self.pos_seq[:]
+        seq_pair.neg_seq = self.neg_seq[:]
+        seq_pair.pos_idx = self.pos_idx[:]
+        seq_pair.neg_idx = self.neg_idx[:]
+        seq_pair.keys = self.keys
+        seq_pair.hash = self.hash
+        return seq_pair
+
+    def assign(self, other):
+        '''Make this sequence pair the same as other one in place.
+        '''
+        self.pos_seq[:] = other.pos_seq
+        self.neg_seq[:] = other.neg_seq
+        self.pos_idx[:] = other.pos_idx
+        self.neg_idx[:] = other.neg_idx
+        if self.keys is not None:
+            self.hash = other.hash if other.keys is self.keys else self.keys.hash(self)
+
+    def pack(self, widths, heights):
+        '''Pack blocks placed by this sequence pair.
+        Return (xs, ys, width, height) as pack() does.
+        '''
+        return _pack(self.pos_seq, self.neg_idx, widths, heights)
+
+    def slacks(self, widths, heights):
+        '''Return (x_slacks, y_slacks), how far each block can be moved right or up without
+        enlarging the packing. Reversing both sequences turns the floorplan by 180 degrees, whose
+        packing gives the longest path from each block to the right and top of the floorplan.
+        '''
+        xs, ys, width, height = self.pack(widths, heights)
+        tail_xs, tail_ys, _, _ = pack(self.pos_seq[::-1], self.neg_seq[::-1], widths, heights)
+        return ([width - x - size - tail for x, size, tail in zip(xs, widths, tail_xs)],
+                [height - y - size - tail for y, size, tail in zip(ys, heights, tail_ys)])
+
+    def __eq__(self, other):
+        return self.pos_seq == other.pos_seq and self.neg_seq == other.neg_seq
+
+    def __repr__(self):
+        return 'SequencePair({0.pos_seq}, {0.neg_seq})'.format(self)
+
+def pack(pos_seq, neg_seq, widths, heights):
+    '''Pack blocks placed by sequence pair (pos_seq, neg_seq).
+    widths[i] and heights[i] are the dimension of block i.
+    Return (xs, ys, width, height), where xs[i] and ys[i] are left-x and bottom-y of block i.
+    '''
+    return _pack(pos_seq, _inverse(neg_seq), widths, heights)
+
+def _pack(pos_seq, neg_idx, widths, heights):
+    '''Pack blocks given positive sequence and index of each block in negative sequence.
+    '''
+    xs, width = _longest_paths(pos_seq, neg_idx, widths)
+    ys, height = _longest_paths(reversed(pos_seq), neg_idx, heights)
+    return xs, ys, width, height
+
+def _inverse(seq):
+    '''Return list mapping each block to its index in given sequence.
+    '''
+    idxes = [0] * len(seq)
+    for idx, blk in enumerate(seq):
+        idxes[blk] = idx
+    return idxes
+
+def _range_hash(seq, blk_keys, idx_keys, low, high):
+    '''Return sum of products of keys of blocks at indexes low to high - 1 in a sequence and keys
+    of the indexes.
+    '''
+    return sum(map(mul, map(blk_keys.__getitem__, seq[low:high]), idx_keys[low:high]))
+
+def _swap(seq, seq_idx, idx0, idx1):
+    '''Swap two blocks at given indexes in a sequence and keep the inverse index consistent.
+    '''
+    blk0, blk1 = seq[idx0], seq[idx1]
+    seq[idx0], seq[idx1] = blk1, blk0
+    seq_idx[blk0], seq_idx[blk1] = idx1, idx0
+
+def _move(seq, seq_idx, idx0, idx1):
+    '''Move block at index idx0 to index idx1 in a sequence, shifting blocks in between, and keep
+    the inverse index consistent.
+    '''
+    seq.insert(idx1, seq.pop(idx0))
+    for idx in range(min(idx0, idx1), max(idx0, idx1) + 1):
+        seq_idx[seq[idx]] = idx
+
+def _longest_paths(order, neg_idx, sizes):
+    '''Find the longest path to each block, visiting blocks in given order.
+    A block is preceded by every block visited earlier and placed before it in negative sequence.
+    Return (coords, total), where total is the length of the longest path through all blocks.
+    '''
+    nblock = len(neg_idx)
+    tree = [0] * (nblock + 1) # Fenwick tree of prefix maximum of block ends
+    coords = [0] * nblock
+    total = 0
+    for blk in order:
+        # max end among visited blocks in negative sequence before this one
+        idx = neg_idx[blk]
+        start = 0
+        while idx > 0:
+            if tree[idx] > start:
+                start = tree[idx]
+            idx -= idx & -idx
+        coords[blk] = start
+        end = start + sizes[blk]
+        if end > total:
+            total = end
+        idx = neg_idx[blk] + 1
+        while idx <= nblock:
+            if tree[idx] >= end:
+                # ranges covered by the rest are supersets, which are no less than this one
+                break
+            tree[idx] = end
+            idx += idx & -idx
+    return coords, total
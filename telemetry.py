@@ -0,0 +1,95 @@
+'''2017PDA PA3 - Fixed Outline Floorplanning.
+
+Telemetry of a run: moves by type, acceptance per temperature step, time spent in packing,
+wire length evaluation and copying, hits of the cache of evaluated floorplans, and moves per
+second of each phase.
+
+Telemetry is collected only if a Telemetry object is given to the floorplan; otherwise hot
+paths skip it with a single check. Counters of graph.py are global, enabled by graph.set_stats()
+along with telemetry.
+'''
+
+import csv
+import json
+
+class Telemetry:
+    '''Counters and timers of a run.
+    '''
+    TIMERS = ('pack', 'hpwl', 'copy')
+    STEP_FIELDS = ('step', 'temp', 'moves', 'uphill', 'rejected', 'accept_ratio', 'seconds')
+
+    def __init__(self, move_names):
+        self.move_names = move_names
+        self.tried = [0] * len(move_names) # by move type
+        self.accepted = [0] * len(move_names)
+        self.seconds = {name: 0.0 for name in self.TIMERS}
+        self.steps = [] # rows of STEP_FIELDS, one per temperature step
+        self.graph = {'graphs': 0, 'propagations': 0, 'edges': 0} # counters of graph.py
+        self.eval_cache = {'hits': 0, 'misses': 0} # lookups of evaluated floorplans
+
+    def count_move(self, move, accepted):
+        '''Count a move of given type.
+        '''
+        self.tried[move] += 1
+        if accepted:
+            self.accepted[move] += 1
+
+    def count_eval(self, hit):
+        '''Count a lookup of evaluated floorplan.
+        '''
+        self.eval_cache['hits' if hit else 'misses'] += 1
+
+    def add_time(self, name, seconds):
+        '''Add seconds spent in one of TIMERS.
+        '''
+        self.seconds[name] += seconds
+
+    def record_step(self, temp, move_cnt, uphill, reject_cnt, seconds):
+        '''Record statistics of a temperature step.
+        '''
+        accept_ratio = (move_cnt - reject_cnt) / move_cnt if move_cnt else 0.0
+        self.steps.append((len(self.steps), temp, move_cnt, uphill, reject_cnt, accept_ratio,
+                           seconds))
+
+    def merge(self, other):
+        '''Add counters and timers of other telemetry, e.g. from a worker process.
+        '''
+        for move in range(len(self.move_names)):
+            self.tried[move] += other.tried[move]
+            self.accepted[move] += other.accepted[move]
+        for name in self.TIMERS:
+            self.seconds[name] += other.seconds[name]
+        for name in self.graph:
+            self.graph[name] += other.graph[name]
+        for name in self.eval_cache:
+            self.eval_cache[name] += other.eval_cache[name]
+
+    def report(self, sched):
+        '''Return telemetry as a dict, including phases of given run-time scheduler.
+        '''
+        phases = {}
+        for phase, seconds in sched.durations.items():
+            moves = sched.moves.get(phase, 0)
+            phases[phase] = {'seconds': seconds, 'moves': moves,
+                             'moves_per_sec': moves / seconds if seconds > 0 else 0.0}
+        moves = {}
+        for move, name in enumerate(self.move_names):
+            moves[name] = {'tried': self.tried[move], 'accepted': self.accepted[move],
+                           'accept_ratio': (self.accepted[move] / self.tried[move]
+                                            if self.tried[move] else 0.0)}
+        lookups = self.eval_cache['hits'] + self.eval_cache['misses']
+        eval_cache = dict(self.eval_cache, hit_ratio=(self.eval_cache['hits'] / lookups
+                                                      if lookups else 0.0))
+        return {'elapsed': sched.elapsed(), 'phases': phases, 'moves': moves,
+                'seconds': self.seconds, 'steps': len(self.steps), 'graph': self.graph,
+                'eval_cache': eval_cache}
+
+    def write(self, prefix, sched):
+        '''Write report to prefix.stats.json and temperature steps to prefix.steps.csv.
+        '''
+        with open(prefix + '.stats.json', 'wt') as ofile:
+            json.dump(self.report(sched), ofile, indent=2)
+        with open(prefix + '.steps.csv', 'wt', newline='') as ofile:
+            writer = csv.writer(ofile)
+            writer.writerow(self.STEP_FIELDS)
+            writer.writerows(self.steps)